@@ -1,8 +1,56 @@
+import argparse
+import hashlib
+import itertools
+import json
 import random
-import yaml
-import requests
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import nullcontext
+import numpy as np
 import os
 
+from build_manifest import BuildManifest
+from carry_control import CARRY_OPTIONS, carry_limits, column_table
+from profiling import StageTimer, span
+
+# The compile backends (and with them requests), pypdf, multiprocessing and
+# cProfile are imported where they are used, so writing .tex from cron or a
+# shell loop pays only for numpy and, to read the config, yaml.
+
+
+# int64 holds every operand up to 18 digits; longer operands use Python ints
+MAX_DIGITS = 18
+INT64_MAX = np.iinfo(np.int64).max
+
+# Pages whose problems are drawn together from one random generator, so
+# array calls are made per block instead of per page
+PAGES_PER_BLOCK = 10
+# Pages rendered per work item when sharding a worksheet across processes;
+# whole blocks, so no block is generated by two shards
+PAGES_PER_SHARD = 3 * PAGES_PER_BLOCK
+
+# Values of a problem type's "unique" key: no repeats within a page, or within the whole worksheet
+UNIQUE_SCOPES = ("page", "workbook")
+
+# Values of "answer_key": extra pages after the worksheet, or a second document
+ANSWER_KEY_MODES = ("pages", "separate")
+ANSWER_KEY_TITLE = "정답"
+# Bytes of answer key pages held in memory while their worksheet is written,
+# beyond which they spill to a temporary file
+KEY_SPOOL_SIZE = 1 << 20
+
+# Problem spaces up to this size are enumerated and shuffled; larger ones are sampled
+ENUMERATE_LIMIT = 1 << 16
+# Spaces beyond this are so large that repeats are practically impossible, so they
+# are drawn independently (also keeps index arithmetic inside int64)
+MAX_INDEX_SPACE = 1 << 60
+# Extra spawn_key entry that keeps workbook-wide streams apart from page streams
+WORKBOOK_SPAWN_TAG = 1 << 32
+
+_rng = np.random.default_rng()
+
 
 def generate_number(digits):
     """Generate a random number with the specified number of digits."""
@@ -13,54 +61,515 @@ def generate_number(digits):
     return random.randint(min_val, max_val)
 
 
+# Operator codes stored in ProblemTable.op
+OP_ADD, OP_SUB, OP_MUL, OP_DIV = range(4)
+OPERATIONS = ("addition", "subtraction", "multiplication", "division")
+LATEX_SYMBOLS = ("+", "-", "\\times", "\\div")
+
+
+class ProblemTable:
+    """
+    Compact, array-backed table of problems.
+
+    Each row is one problem: operator code, operands a and b, the answer and,
+    for division, the remainder. Strings are only produced at render time.
+    """
+
+    __slots__ = ("op", "a", "b", "answer", "remainder")
+
+    def __init__(self, op, a, b, answer, remainder):
+        self.op = op
+        self.a = a
+        self.b = b
+        self.answer = answer
+        self.remainder = remainder
+
+    @classmethod
+    def from_operands(cls, op, a, b):
+        """
+        Build a table for one operator code, computing the answers. Products
+        that would overflow int64 are computed on Python ints, so answers are
+        exact for int64 and object operands alike.
+        """
+        if op == OP_MUL and a.dtype != object and b.dtype != object and len(a) and \
+                int(np.abs(a).max()) * int(np.abs(b).max()) > INT64_MAX:
+            a, b = a.astype(object), b.astype(object)
+        remainder = np.zeros(len(a), dtype=np.int64)
+        if op == OP_SUB:
+            answer = a - b
+        elif op == OP_MUL:
+            answer = a * b
+        elif op == OP_DIV:
+            # np.divmod does not support object arrays
+            answer, remainder = a // b, a % b
+        else:
+            answer = a + b
+        return cls(np.full(len(a), op, dtype=np.int8), a, b, answer, remainder)
+
+    @classmethod
+    def concat(cls, tables):
+        """Concatenate several tables into one."""
+        return cls(*(np.concatenate([getattr(t, name) for t in tables]) for name in cls.__slots__))
+
+    def take(self, indices):
+        """Return a new table with the rows at the given indices."""
+        return ProblemTable(*(getattr(self, name)[indices] for name in self.__slots__))
+
+    def split(self, parts):
+        """Split the table into parts tables of equal length, in row order."""
+        size = len(self) // parts
+        return [self.take(slice(part * size, (part + 1) * size)) for part in range(parts)]
+
+    def __len__(self):
+        return len(self.op)
+
+    def __iter__(self):
+        """Iterate over rows as (op, a, b, answer, remainder) tuples of Python ints."""
+        return zip(*(getattr(self, name).tolist() for name in self.__slots__))
+
+
+def format_problem(op, a, b):
+    """Format a single problem as LaTeX math, e.g. '12 \\times 3 ='."""
+    return f"{a} {LATEX_SYMBOLS[op]} {b} ="
+
+
+def format_answer(op, answer, remainder):
+    """Format an answer as LaTeX math; a division remainder is written as '7 \\cdots 2'."""
+    if op == OP_DIV and remainder:
+        return f"{answer} \\cdots {remainder}"
+    return str(answer)
+
+
+def check_answer(op, a, b, answer, remainder):
+    """
+    Raise ValueError unless answer and remainder are exact for the problem,
+    so an answer key never shows a value that overflowed int64.
+    """
+    if op == OP_DIV:
+        expected = divmod(a, b)
+    elif op == OP_SUB:
+        expected = (a - b, 0)
+    elif op == OP_MUL:
+        expected = (a * b, 0)
+    else:
+        expected = (a + b, 0)
+    if (answer, remainder) != expected:
+        raise ValueError(f"wrong answer {format_answer(op, answer, remainder)} for {format_problem(op, a, b)} "
+                         f"(expected {format_answer(op, *expected)})")
+
+
 def generate_problem(problem_config):
-    """Generate a single arithmetic problem based on configuration."""
+    """
+    Generate a single arithmetic problem based on configuration. Plain Python
+    ints are faster than a batch of one, except for carry/borrow control.
+    """
+    if carry_limits(problem_config) is not None:
+        op, a, b, _, _ = next(iter(generate_problems_batch(problem_config, 1)))
+        return format_problem(op, a, b)
     p_type = problem_config.get("type", "addition")
-    operands_digits = problem_config.get("operands", [1, 1])
+    digits_a, digits_b = problem_config.get("operands", [1, 1])
+    a = generate_number(digits_a)
+    b = generate_number(digits_b)
     easymode = problem_config.get("easymode", False)
+    if p_type == "subtraction" and easymode:
+        a, b = max(a, b), min(a, b)
+    elif p_type == "division" and easymode:
+        a, b = a * b, a
+    return format_problem(OPERATIONS.index(p_type) if p_type in OPERATIONS else OP_ADD, a, b)
+
+
+def check_digits(digits, max_digits=None):
+    if digits < 1:
+        raise ValueError("Number of digits must be at least 1")
+    if max_digits is not None and digits > max_digits:
+        raise ValueError(f"Number of digits must be at most {max_digits}")
+
+
+def generate_numbers(digits, n, rng=None):
+    """
+    Generate an array of n random numbers with the specified number of digits.
+
+    Up to MAX_DIGITS digits the array is int64. Longer numbers are built from
+    int64 blocks of MAX_DIGITS digits into an object array of Python ints.
+    """
+    check_digits(digits)
+    rng = rng or _rng
+    lead_digits = digits - (digits - 1) // MAX_DIGITS * MAX_DIGITS
+    numbers = rng.integers(10 ** (lead_digits - 1), 10**lead_digits - 1, size=n, endpoint=True, dtype=np.int64)
+    if lead_digits == digits:
+        return numbers
+    numbers = numbers.astype(object)
+    for _ in range((digits - lead_digits) // MAX_DIGITS):
+        block = rng.integers(0, 10**MAX_DIGITS - 1, size=n, endpoint=True, dtype=np.int64)
+        numbers = numbers * 10**MAX_DIGITS + block.astype(object)
+    return numbers
+
+
+def generate_problems_batch(problem_config, n, rng=None):
+    """
+    Generate n arithmetic problems of a single type in one vectorized pass.
 
-    nums = [generate_number(d) for d in operands_digits]
+    Every operand of the block is drawn at once and the easymode rules are
+    applied as array operations. Problem types with a carry/borrow option have
+    their operands built digit by digit instead. Returns a ProblemTable.
+    """
+    operands_digits = problem_config.get("operands", [1, 1])
+    if carry_limits(problem_config) is not None:
+        # Operands are built column by column in int64
+        for digits in operands_digits:
+            check_digits(digits, MAX_DIGITS)
+        a, b = column_table(problem_config).sample(n, rng or _rng)
+    else:
+        a = generate_numbers(operands_digits[0], n, rng)
+        b = generate_numbers(operands_digits[1], n, rng)
+    return problems_from_operands(problem_config, a, b)
+
+
+def problems_from_operands(problem_config, a, b):
+    """Apply a problem type and its easymode rules to drawn operands. Returns a ProblemTable."""
+    p_type = problem_config.get("type", "addition")
+    operands_digits = problem_config.get("operands", [1, 1])
+    easymode = problem_config.get("easymode", False)
 
-    if p_type == "addition":
-        return f"{nums[0]} + {nums[1]} ="
-    elif p_type == "subtraction":
+    if p_type == "subtraction":
+        op = OP_SUB
         if easymode:
             # Ensure A >= B for no negative result
-            a, b = max(nums[0], nums[1]), min(nums[0], nums[1])
-            return f"{a} - {b} ="
-        return f"{nums[0]} - {nums[1]} ="
+            a, b = np.maximum(a, b), np.minimum(a, b)
     elif p_type == "multiplication":
-        return f"{nums[0]} \\times {nums[1]} ="
+        op = OP_MUL
     elif p_type == "division":
+        op = OP_DIV
         if easymode:
             # Generate A * B ÷ A to ensure integer result
-            divisor = nums[0]
-            quotient = nums[1]
-            dividend = divisor * quotient
-            return f"{dividend} \\div {divisor} ="
-        return f"{nums[0]} \\div {nums[1]} ="
-    
-    return f"{nums[0]} + {nums[1]} ="
+            if operands_digits[0] + operands_digits[1] > MAX_DIGITS:
+                # Fall back to Python ints where the product would overflow int64
+                a, b = a.astype(object) * b, a
+            else:
+                a, b = a * b, a
+    else:
+        op = OP_ADD
 
+    return ProblemTable.from_operands(op, a, b)
 
-def generate_latex(config):
+
+def problem_space_size(problem_config):
+    """Number of distinct problems a problem type can produce."""
+    if carry_limits(problem_config) is not None:
+        return column_table(problem_config).size
+    digits_a, digits_b = problem_config.get("operands", [1, 1])
+    count_a = 9 * 10 ** (digits_a - 1)
+    count_b = 9 * 10 ** (digits_b - 1)
+    if _triangular_space(problem_config):
+        # Easy subtraction orders each pair, so (x, y) and (y, x) are one problem
+        return count_a * (count_a + 1) // 2
+    return count_a * count_b
+
+
+def _triangular_space(problem_config):
+    digits_a, digits_b = problem_config.get("operands", [1, 1])
+    return (problem_config.get("type") == "subtraction" and problem_config.get("easymode", False)
+            and digits_a == digits_b)
+
+
+def operands_from_index(problem_config, index):
+    """Map problem indices in [0, problem_space_size) to distinct drawn operands (a, b)."""
+    if carry_limits(problem_config) is not None:
+        return column_table(problem_config).unrank(index)
+    digits_a, digits_b = problem_config.get("operands", [1, 1])
+    low_a = 10 ** (digits_a - 1)
+    low_b = 10 ** (digits_b - 1)
+    if _triangular_space(problem_config):
+        # Row r of the triangle holds the pairs (r, 0..r); fix up float rounding of the root
+        row = ((np.sqrt(8 * index.astype(np.float64) + 1) - 1) // 2).astype(np.int64)
+        row -= row * (row + 1) // 2 > index
+        row += (row + 1) * (row + 2) // 2 <= index
+        return low_a + row, low_a + index - row * (row + 1) // 2
+    count_b = 9 * 10 ** (digits_b - 1)
+    return low_a + index // count_b, low_b + index % count_b
+
+
+def _shuffled_positions(size, start, n, epoch_rng):
     """
-    Generate LaTeX code for arithmetic worksheets based on configuration.
+    Positions [start, start + n) of an endless sequence of shuffles of
+    range(size): every `size` consecutive positions hold each index once.
     """
-    n_page = config["n_page"]
-    page_offset = config["page_offset"]
+    epochs, offsets = np.divmod(np.arange(start, start + n, dtype=np.int64), size)
+    indices = np.empty(n, dtype=np.int64)
+    for epoch in np.unique(epochs).tolist():
+        selected = epochs == epoch
+        indices[selected] = epoch_rng(epoch).permutation(size)[offsets[selected]]
+    return indices
+
+
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+
+
+def _mix(values, key):
+    """SplitMix64 finalizer, the Feistel round function."""
+    z = values ^ key
+    z = (z ^ (z >> np.uint64(30))) * _MIX1
+    z = (z ^ (z >> np.uint64(27))) * _MIX2
+    return z ^ (z >> np.uint64(31))
+
+
+def _feistel_permute(offsets, size, rng, rounds=4):
+    """
+    Send offsets in [0, size) through a keyed pseudo-random permutation of
+    range(size) without materializing it: a balanced Feistel network over the
+    next even power of two, cycle-walking results that land outside the range
+    (fewer than four steps on average).
+    """
+    half = max(1, ((size - 1).bit_length() + 1) // 2)
+    shift = np.uint64(half)
+    mask = np.uint64((1 << half) - 1)
+    keys = rng.integers(0, 2**64, size=rounds, dtype=np.uint64)
+    values = offsets.astype(np.uint64)
+    todo = np.arange(len(values))
+    while len(todo):
+        left, right = values[todo] >> shift, values[todo] & mask
+        for key in keys:
+            left, right = right, left ^ (_mix(right, key) & mask)
+        values[todo] = (left << shift) | right
+        todo = todo[values[todo] >= np.uint64(size)]
+    return values.astype(np.int64)
+
+
+def _permuted_positions(size, start, n, epoch_rng):
+    """Like _shuffled_positions, for spaces too large to shuffle in memory."""
+    epochs, offsets = np.divmod(np.arange(start, start + n, dtype=np.int64), size)
+    indices = np.empty(n, dtype=np.int64)
+    for epoch in np.unique(epochs).tolist():
+        selected = epochs == epoch
+        indices[selected] = _feistel_permute(offsets[selected], size, epoch_rng(epoch))
+    return indices
+
+
+def _sample_distinct(size, n, rng):
+    """Draw n distinct indices from a large range(size), redrawing the rare repeats via a seen-set."""
+    indices = rng.integers(0, size, size=n, dtype=np.int64)
+    seen = set()
+    for i, index in enumerate(indices.tolist()):
+        while index in seen:
+            index = int(rng.integers(0, size))
+        seen.add(index)
+        indices[i] = index
+    return indices
+
+
+def generate_unique_batch(problem_config, n, rng, sequence_rng=None, page_index=0, per_page=0):
+    """
+    Generate n distinct problems of a single type. Problems only repeat once
+    the type's whole problem space has been used.
+
+    The problems are read from a shuffled sequence of the problem space. With
+    sequence_rng(epoch) that sequence is shared by the whole worksheet and each
+    page reads its own window of per_page positions, so pages never repeat each
+    other until the space runs out; without it the sequence is drawn from rng
+    for this batch alone. Small spaces are enumerated and shuffled. Large ones
+    use a seen-set within a batch, or a keyed permutation across a worksheet,
+    so cost stays O(n).
+    """
+    size = problem_space_size(problem_config)
+    if size > MAX_INDEX_SPACE:
+        return generate_problems_batch(problem_config, n, rng)
+
+    start = 0
+    if sequence_rng is not None:
+        # Fit whole pages into each pass over the space, so no page straddles two shuffles
+        pages_per_pass = size // per_page if per_page else 0
+        if pages_per_pass:
+            start = page_index // pages_per_pass * size + page_index % pages_per_pass * per_page
+        else:
+            start = page_index * per_page
+
+    if size <= ENUMERATE_LIMIT:
+        index = _shuffled_positions(size, start, n, sequence_rng or (lambda epoch: rng))
+    elif sequence_rng is not None or 2 * n > size:
+        index = _permuted_positions(size, start, n, sequence_rng or (lambda epoch: rng))
+    else:
+        index = _sample_distinct(size, n, rng)
+
+    a, b = operands_from_index(problem_config, index)
+    return problems_from_operands(problem_config, a, b)
+
+
+def generate_block_problems(problems_config, detailed_counts, total_questions, n_pages, rng=None, workbook=None):
+    """
+    Generate the ProblemTables of n_pages consecutive pages, one vectorized
+    batch per problem type for all of them, so array overhead is paid per block.
+
+    workbook is (seed, stream, page_index) of the first page within its
+    worksheet; it is needed for problem types with `unique: workbook`, which
+    otherwise only avoid repeats within each page.
+    """
+    rng = rng or _rng
+    if detailed_counts:
+        counts = [p.get("questions_per_page", 0) for p in problems_config]
+        pattern = np.repeat(np.arange(len(problems_config)), counts)
+        # Shuffle each page so different problem types are mixed
+        block_of = rng.permuted(np.tile(pattern, (n_pages, 1)), axis=1)
+    else:
+        # Randomly sample from provided types for every slot of every page
+        block_of = rng.integers(0, len(problems_config), size=(n_pages, total_questions))
+
+    tables = []
+    slots = []
+    for k, p_config in enumerate(problems_config):
+        is_k = block_of == k
+        block_slots = np.flatnonzero(is_k)
+        if not len(block_slots):
+            continue
+        unique = p_config.get("unique")
+        if not unique:
+            tables.append(generate_problems_batch(p_config, len(block_slots), rng))
+        elif unique not in UNIQUE_SCOPES:
+            raise ValueError(f"unique must be one of {', '.join(UNIQUE_SCOPES)} (got {unique!r})")
+        else:
+            # Problems are distinct within each page, so unique types are drawn page by page
+            per_page = p_config.get("questions_per_page", 0) if detailed_counts else total_questions
+            for page, n in enumerate(np.count_nonzero(is_k, axis=1).tolist()):
+                if not n:
+                    continue
+                if unique == "workbook" and workbook is not None:
+                    # Each page owns a fixed window of a worksheet-wide sequence, so any
+                    # page can still be generated on its own
+                    seed, stream, first_page = workbook
+                    tables.append(generate_unique_batch(
+                        p_config, n, rng,
+                        sequence_rng=lambda epoch, k=k: workbook_rng(seed, stream, k, epoch),
+                        page_index=first_page + page,
+                        per_page=per_page
+                    ))
+                else:
+                    tables.append(generate_unique_batch(p_config, n, rng))
+        slots.append(block_slots)
+
+    if not tables:
+        empty = np.zeros(0, dtype=np.int64)
+        return ProblemTable.from_operands(OP_ADD, empty, empty).split(n_pages)
+    # Put every problem back into its slot, page by page
+    order = np.argsort(np.concatenate(slots), kind="stable")
+    return ProblemTable.concat(tables).take(order).split(n_pages)
+
+
+def question_count(config):
+    """Return (detailed_counts, total_questions) for a worksheet config."""
     problems_config = config["problems"]
-    
+
     # Check if questions_per_page varies by problem type
     detailed_counts = any("questions_per_page" in p for p in problems_config)
-    
+
     if detailed_counts:
         total_questions = sum(p.get("questions_per_page", 0) for p in problems_config)
     else:
         total_questions = config.get("questions_per_page", 20)
+    return detailed_counts, total_questions
+
+
+def answer_key_mode(config):
+    """Return the worksheet's answer key layout, one of ANSWER_KEY_MODES, or None for no key."""
+    mode = config.get("answer_key", False)
+    if mode is True:
+        return "pages"
+    if not mode:
+        return None
+    if mode not in ANSWER_KEY_MODES:
+        raise ValueError(f"answer_key must be true, false or one of {', '.join(ANSWER_KEY_MODES)} (got {mode!r})")
+    return mode
+
+
+def answer_key_output(output_file):
+    """Output file of the separate answer key document, e.g. luna_answers.pdf for luna.pdf."""
+    stem, ext = os.path.splitext(output_file)
+    return f"{stem}_answers{ext}"
+
+
+def page_count(config):
+    """Pages in the worksheet's document, answer key pages included."""
+    return config["n_page"] * (2 if answer_key_mode(config) == "pages" else 1)
+
+
+def resolve_seed(config):
+    """
+    Return the worksheet's seed: the config's "seed" key, or fresh entropy if
+    none is set. Resolve it once per run so every page derives from the same seed.
+    """
+    seed = config.get("seed")
+    if seed is None:
+        return np.random.SeedSequence().entropy
+    if not isinstance(seed, int) or seed < 0:
+        raise ValueError("seed must be a non-negative integer")
+    return seed
+
 
-    # LaTeX document header
-    latex_content = r"""\documentclass[12pt,a4paper]{article}
+def config_hash(config, seed=None):
+    """
+    Canonical SHA-256 of a worksheet config (key order does not matter),
+    optionally combined with a resolved seed.
+    """
+    canonical = json.dumps(config, sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.sha256(canonical.encode("utf-8"))
+    if seed is not None:
+        digest.update(f"\0{seed}".encode("ascii"))
+    return digest.hexdigest()
+
+
+def block_rng(seed, stream, block):
+    """
+    Independent random generator for one block of PAGES_PER_BLOCK pages of one generation.
+
+    Each (stream, block) pair gets its own child of the seed, so any block
+    can be produced on its own, in any order, and always comes out the same.
+    """
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(stream, block)))
+
+
+def workbook_rng(seed, stream, block, epoch):
+    """Generator shared by every page of a generation, for one problem type's unique sequence."""
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(stream, WORKBOOK_SPAWN_TAG, block, epoch)))
+
+
+def generate_block(config, block, seed=None):
+    """
+    Generate the ProblemTables of the PAGES_PER_BLOCK pages in one block
+    directly, without the blocks before it. Pages past n_page are generated
+    too, so a page's problems do not depend on the worksheet's length.
+    """
+    if seed is None:
+        seed = resolve_seed(config)
+    detailed_counts, total_questions = question_count(config)
+    with span("generate"):
+        stream = config.get("stream", 0)
+        rng = block_rng(seed, stream, block)
+        return generate_block_problems(
+            config["problems"], detailed_counts, total_questions, PAGES_PER_BLOCK, rng,
+            workbook=(seed, stream, block * PAGES_PER_BLOCK)
+        )
+
+
+def generate_page(config, page_index, seed=None):
+    """Generate the ProblemTable of a single page directly, with its block but without the pages before it."""
+    return generate_block(config, page_index // PAGES_PER_BLOCK, seed)[page_index % PAGES_PER_BLOCK]
+
+
+def iter_pages(config, seed=None):
+    """Lazily generate the problems of each page as a ProblemTable, a block at a time."""
+    if seed is None:
+        seed = resolve_seed(config)
+    n_page = config["n_page"]
+    for block in range(-(-n_page // PAGES_PER_BLOCK)):
+        yield from generate_block(config, block, seed)[:n_page - block * PAGES_PER_BLOCK]
+
+
+def generate_worksheet(config):
+    """Generate the problems of every page as a list of ProblemTables."""
+    return list(iter_pages(config))
+
+
+# LaTeX document header
+LATEX_PREAMBLE = r"""\documentclass[12pt,a4paper]{article}
 \usepackage[utf8]{inputenc}
 \usepackage[margin=2cm]{geometry}
 \usepackage{multicol}
@@ -81,133 +590,817 @@ def generate_latex(config):
 
 """
 
-    # Set starting page number
-    latex_content += f"\\setcounter{{page}}{{{page_offset}}}\n\n"
-
-    # Generate pages
-    for page_num in range(n_page):
-        # Prepare list of problem configs for this page
-        current_page_problems_config = []
-        if detailed_counts:
-            for p_conf in problems_config:
-                count = p_conf.get("questions_per_page", 0)
-                current_page_problems_config.extend([p_conf] * count)
-            # Shuffle so different problem types are mixed
-            random.shuffle(current_page_problems_config)
-        else:
-            # Randomly sample from provided types for the whole page
-            current_page_problems_config = [random.choice(problems_config) for _ in range(total_questions)]
+# LaTeX document footer
+LATEX_FOOTER = r"""
+\end{CJK}
+\end{document}
+"""
+
+
+def font_settings(total_questions):
+    """Determine font size and spacing based on total questions to prevent overflow."""
+    if total_questions <= 20:
+        return r"\Large", r"0.8cm"
+    elif total_questions <= 30:
+        return r"\large", r"0.5cm"
+    elif total_questions <= 40:
+        return r"\normalsize", r"0.3cm"
+    return r"\small", r"0.2cm"
 
+
+def render_page(page_problems, font_size, v_space):
+    """Render the LaTeX code for a single page."""
+    with span("latex"):
         # Date field at top
-        latex_content += r"\noindent 날짜: \underline{\hspace{5cm}}" + "\n\n"
-        latex_content += r"\vspace{0.5cm}" + "\n\n"
-
-        # Determine font size and spacing based on total questions to prevent overflow
-        if total_questions <= 20:
-            font_size = r"\Large"
-            v_space = r"0.8cm"
-        elif total_questions <= 30:
-            font_size = r"\large"
-            v_space = r"0.5cm"
-        elif total_questions <= 40:
-            font_size = r"\normalsize"
-            v_space = r"0.3cm"
-        else:
-            font_size = r"\small"
-            v_space = r"0.2cm"
+        parts = [r"\noindent 날짜: \underline{\hspace{5cm}}" + "\n\n", r"\vspace{0.5cm}" + "\n\n"]
 
         # Start 2-column layout
-        latex_content += r"\begin{multicols}{2}" + "\n"
-        latex_content += f"{font_size}\n\n"
+        parts.append(r"\begin{multicols}{2}" + "\n")
+        parts.append(f"{font_size}\n\n")
 
-        # Generate problems per page
-        for i, p_config in enumerate(current_page_problems_config, 1):
-            problem_str = generate_problem(p_config)
+        for i, (op, a, b, _, _) in enumerate(page_problems, 1):
+            problem_str = format_problem(op, a, b)
 
             # Format: numbered problem with blank for answer
-            latex_content += f"\\noindent {i}. \\quad ${problem_str}$ \\underline{{\\hspace{{3cm}}}}\n\n"
-            latex_content += f"\\vspace{{{v_space}}}\n\n"
+            parts.append(f"\\noindent {i}. \\quad ${problem_str}$ \\underline{{\\hspace{{3cm}}}}\n\n")
+            parts.append(f"\\vspace{{{v_space}}}\n\n")
 
         # End 2-column layout
-        latex_content += r"\end{multicols}" + "\n\n"
+        parts.append(r"\end{multicols}" + "\n\n")
+        return "".join(parts)
 
-        # Add page break if not the last page
-        if page_num < n_page - 1:
-            latex_content += r"\newpage" + "\n\n"
 
-    # LaTeX document footer
-    latex_content += r"""
-\end{CJK}
-\end{document}
-"""
+def render_answer_page(page_problems, page_number, font_size, v_space):
+    """
+    Render the answer key for one worksheet page, laid out like the page
+    itself with each blank filled in. page_number is the worksheet page's.
+    """
+    with span("latex"):
+        parts = [f"\\noindent \\textbf{{{ANSWER_KEY_TITLE}}} ({page_number}쪽)\n\n", r"\vspace{0.5cm}" + "\n\n"]
+        parts.append(r"\begin{multicols}{2}" + "\n")
+        parts.append(f"{font_size}\n\n")
+
+        for i, (op, a, b, answer, remainder) in enumerate(page_problems, 1):
+            check_answer(op, a, b, answer, remainder)
+            problem_str = format_problem(op, a, b)
+            answer_str = format_answer(op, answer, remainder)
+            parts.append(f"\\noindent {i}. \\quad ${problem_str}$ $\\mathbf{{{answer_str}}}$\n\n")
+            parts.append(f"\\vspace{{{v_space}}}\n\n")
+
+        parts.append(r"\end{multicols}" + "\n\n")
+        return "".join(parts)
 
-    return latex_content
+
+def render_answer_pages(config, pages, start=0):
+    """Render the answer key page of each worksheet page (ProblemTables) from page index start on."""
+    _, total_questions = question_count(config)
+    font_size, v_space = font_settings(total_questions)
+    return [render_answer_page(page_problems, config["page_offset"] + page_index, font_size, v_space)
+            for page_index, page_problems in enumerate(pages, start)]
+
+
+def render_pages(config, seed, start, stop, answer_key=False):
+    """
+    Render the LaTeX of each page in [start, stop) of a worksheet, one string
+    per page. With answer_key, returns (pages, key pages): the answer key
+    pages are rendered from the same problems.
+    """
+    _, total_questions = question_count(config)
+    font_size, v_space = font_settings(total_questions)
+    tables = generate_page_range(config, seed, start, stop)
+    pages = [render_page(page_problems, font_size, v_space) for page_problems in tables]
+    if answer_key:
+        return pages, render_answer_pages(config, tables, start)
+    return pages
+
+
+def render_page_range(config, seed, start, stop, answer_key=False):
+    """
+    Render the LaTeX for pages [start, stop) of a worksheet, exactly as
+    iter_latex would. Used to shard large worksheets across processes.
+    With answer_key, returns (pages, key pages) as two such chunks.
+    """
+    rendered = render_pages(config, seed, start, stop, answer_key)
+    if answer_key:
+        return tuple(_join_pages(pages, start) for pages in rendered)
+    return _join_pages(rendered, start)
+
+
+def _join_pages(pages, start):
+    """Join rendered pages, the first being page index start, with page breaks between them."""
+    parts = []
+    for page_index, page in enumerate(pages, start):
+        # Page break between pages
+        if page_index > 0:
+            parts.append(r"\newpage" + "\n\n")
+        parts.append(page)
+    return "".join(parts)
+
+
+def generate_page_range(config, seed, start, stop):
+    """Generate the ProblemTables for pages [start, stop) of a worksheet, a block at a time."""
+    pages = []
+    for block in range(start // PAGES_PER_BLOCK, -(-stop // PAGES_PER_BLOCK)):
+        first = block * PAGES_PER_BLOCK
+        pages.extend(generate_block(config, block, seed)[max(start - first, 0):stop - first])
+    return pages
+
+
+def page_ranges(n_page, size=PAGES_PER_SHARD):
+    """Split n_page pages into (start, stop) ranges of at most size pages."""
+    return [(start, min(start + size, n_page)) for start in range(0, n_page, size)]
+
+
+def iter_latex(config, pages=None, page_chunks=None, key_chunks=None, seed=None, key_fp=None):
+    """
+    Yield the LaTeX document in chunks: the preamble, then one chunk per page,
+    then the footer. Pages are generated lazily unless already given, either as
+    ProblemTables (pages) or as pre-rendered page ranges (page_chunks).
+    Generated pages derive from seed, resolved from config if not given.
+
+    Answer key pages are rendered from the same ProblemTables in the same
+    pass: into key_fp as a separate document if given, or else with
+    `answer_key: pages` into a spool file that follows the worksheet pages.
+    With page_chunks, the key pages come pre-rendered as key_chunks, which
+    are read once the worksheet is exhausted.
+    """
+    page_offset = config["page_offset"]
+    _, total_questions = question_count(config)
+    font_size, v_space = font_settings(total_questions)
+    key_pages = key_fp is None and answer_key_mode(config) == "pages"
+    if seed is None:
+        seed = resolve_seed(config)
+
+    # Set starting page number
+    header = LATEX_PREAMBLE + f"\\setcounter{{page}}{{{page_offset}}}\n\n"
+    yield header
+
+    if page_chunks is not None:
+        yield from page_chunks
+    else:
+        key_out = key_fp
+        if key_pages:
+            key_out = _key_spool()
+            key_chunks = _iter_spool(key_out)
+        elif key_fp is not None:
+            key_fp.write(header)
+        for page_num, page_problems in enumerate(iter_pages(config, seed) if pages is None else pages):
+            # Page break between pages
+            page_break = r"\newpage" + "\n\n" if page_num > 0 else ""
+            yield page_break + render_page(page_problems, font_size, v_space)
+            if key_out is not None:
+                key_out.write(page_break + render_answer_page(page_problems, page_offset + page_num,
+                                                              font_size, v_space))
+        if key_fp is not None:
+            key_fp.write(LATEX_FOOTER)
+
+    if key_pages:
+        yield r"\newpage" + "\n\n"
+        yield from key_chunks
+
+    yield LATEX_FOOTER
+
+
+def _key_spool():
+    """Temporary text file holding answer key pages until their worksheet is written."""
+    import tempfile
+
+    return tempfile.SpooledTemporaryFile(max_size=KEY_SPOOL_SIZE, mode="w+", encoding="utf-8")
+
+
+def _iter_spool(spool, size=1 << 16):
+    """Yield everything written to a spool in chunks, then close it."""
+    with spool:
+        spool.seek(0)
+        yield from iter(lambda: spool.read(size), "")
+
+
+def _spool_key_chunks(chunks, spool):
+    """Yield the worksheet chunk of each (worksheet, key) chunk pair, writing the key chunk to spool."""
+    for chunk, key_chunk in chunks:
+        spool.write(key_chunk)
+        yield chunk
+
+
+def iter_answer_pages(config, pages):
+    """Yield the LaTeX of the answer key page of each of pages (ProblemTables), with page breaks between them."""
+    _, total_questions = question_count(config)
+    font_size, v_space = font_settings(total_questions)
+    for page_num, page_problems in enumerate(pages):
+        page_break = r"\newpage" + "\n\n" if page_num > 0 else ""
+        yield page_break + render_answer_page(page_problems, config["page_offset"] + page_num, font_size, v_space)
+
+
+def iter_answer_key(config, pages=None, key_chunks=None):
+    """
+    Yield the separate answer key document in chunks, like iter_latex, for
+    pages (ProblemTables) or pre-rendered key_chunks.
+    """
+    yield LATEX_PREAMBLE + f"\\setcounter{{page}}{{{config['page_offset']}}}\n\n"
+    yield from iter_answer_pages(config, pages) if key_chunks is None else key_chunks
+    yield LATEX_FOOTER
+
+
+def write_latex(config, fp, pages=None, page_chunks=None, key_chunks=None, seed=None, key_fp=None):
+    """
+    Stream the LaTeX document to a text file object, one page at a time. With
+    key_fp, the separate answer key document is written to it in the same pass.
+    """
+    for chunk in iter_latex(config, pages, page_chunks, key_chunks, seed, key_fp):
+        fp.write(chunk)
+
+
+def write_answer_key(config, fp, pages=None, key_chunks=None):
+    """Stream the separate answer key document to a text file object."""
+    for chunk in iter_answer_key(config, pages, key_chunks):
+        fp.write(chunk)
+
+
+def generate_latex(config, page_chunks=None, key_chunks=None, seed=None):
+    """
+    Generate LaTeX code for arithmetic worksheets based on configuration.
+
+    With `answer_key: pages` the answer key is included as extra pages. For
+    `answer_key: separate` use generate_latex_documents.
+    """
+    return "".join(iter_latex(config, page_chunks=page_chunks, key_chunks=key_chunks, seed=seed))
+
+
+def generate_latex_documents(config):
+    """
+    Generate the worksheet LaTeX and, with `answer_key: separate`, the answer
+    key LaTeX from the same problems in one pass. Returns (worksheet, key or None).
+    """
+    pages = generate_worksheet(config)
+    worksheet = render_latex(config, pages)
+    if answer_key_mode(config) != "separate":
+        return worksheet, None
+    return worksheet, "".join(iter_answer_key(config, pages))
+
+
+def render_latex(config, pages):
+    """Render LaTeX code for already generated pages (ProblemTables), answer key pages included."""
+    return "".join(iter_latex(config, pages))
+
+
+def iter_shards(work, executor=None, window=1):
+    """
+    Run (fn, args) work items and yield a Future per item, in input order.
+
+    With an executor, up to window items run ahead in worker processes while
+    the caller consumes earlier results; without one, each item runs on demand.
+    """
+    pending = deque()
+    for fn, args in work:
+        if executor is None:
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            yield future
+            continue
+        pending.append(executor.submit(fn, *args))
+        if len(pending) >= window:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
 
 
 def compile_tex_with_texlivenet(tex_content):
     """Compile LaTeX content to PDF using TeXLive.net API."""
-    try:
-        response = requests.post(
-            "https://texlive.net/cgi-bin/latexcgi",
-            files={
-                "filename[]": (None, "document.tex"),
-                "filecontents[]": (None, tex_content),
-                "return": (None, "pdf"),
-            },
-            timeout=60
-        )
+    from tex_compiler import TeXLiveNetBackend
+
+    return TeXLiveNetBackend().compile(tex_content)
+
+
+def print_summary(gen_config):
+    print(f"  - Pages: {gen_config.get('n_page')}")
+    print(f"  - Start Page: {gen_config.get('page_offset')}")
+    print("  - Done.")
 
-        if response.status_code == 200 and response.headers.get('content-type') == 'application/pdf':
-            return True, response.content
-        else:
-            return False, response.text[:500] if response.text else "Unknown error from API"
-    except Exception as e:
-        return False, str(e)
 
+RENDERERS = ("latex", "native")
+COMMANDS = ("generate", "compile", "validate", "bench")
+
+
+def load_config(path):
+    """Load a YAML config file, printing an error and returning None on failure."""
+    import yaml
 
-def main():
     try:
-        with open("config.yaml", "r", encoding="utf-8") as f:
-            config_data = yaml.safe_load(f)
+        with open(path, "r", encoding="utf-8") as f:
+            return yaml.safe_load(f) or {}
     except FileNotFoundError:
-        print("Error: config.yaml not found.")
-        return
+        print(f"Error: {path} not found.")
     except yaml.YAMLError as exc:
-        print(f"Error parsing config.yaml: {exc}")
-        return
+        print(f"Error parsing {path}: {exc}")
+    return None
+
+
+def parse_args(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    # Without a subcommand, behave like `generate` as the script always has
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ("-h", "--help")):
+        argv = ["generate"] + list(argv)
+
+    parser = argparse.ArgumentParser(description="Generate arithmetic worksheets from config.yaml.")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+
+    generate = commands.add_parser("generate", help="Write every output configured in config.yaml (default)")
+    generate.add_argument("--config", default="config.yaml", help="Config file (default: config.yaml)")
+    generate.add_argument(
+        "--renderer",
+        choices=RENDERERS,
+        help="How .pdf outputs are produced: 'latex' compiles the LaTeX source, "
+             "'native' writes the PDF directly without LaTeX (default: config.yaml 'renderer' or latex)"
+    )
+    generate.add_argument(
+        "--jobs",
+        type=int,
+        help="Worker processes for generating pages and generations (default: config.yaml 'jobs' or 1)"
+    )
+    generate.add_argument(
+        "--force",
+        action="store_true",
+        help="Rebuild every output, even those the build manifest says are up to date"
+    )
+    generate.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and rebuild changed generations whenever the config file changes"
+    )
+    generate.add_argument(
+        "--interval",
+        type=float,
+        default=1.0,
+        help="With --watch, seconds between checks of the config file (default: 1.0)"
+    )
+    generate.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print a per-stage timing breakdown and the top functions from cProfile"
+    )
+    generate.add_argument(
+        "--profile-output",
+        metavar="FILE",
+        help="With --profile, also save the raw cProfile stats to FILE"
+    )
+
+    compile_ = commands.add_parser("compile", help="Compile existing .tex files to PDF")
+    compile_.add_argument("tex_files", nargs="+", metavar="FILE.tex")
+    compile_.add_argument("--config", default="config.yaml",
+                          help="Config file whose 'compile' section is used, if it exists (default: config.yaml)")
+    compile_.add_argument("--backend", help="Compile backend, overriding config.yaml (e.g. texlivenet, pdflatex)")
+    compile_.add_argument("-o", "--output", help="Output PDF (only with a single input file)")
+
+    validate = commands.add_parser("validate", help="Check config.yaml without writing anything")
+    validate.add_argument("--config", default="config.yaml", help="Config file (default: config.yaml)")
+
+    commands.add_parser("bench", help="Run the benchmark suite (options are passed to bench.py)", add_help=False)
+
+    if argv[0] == "bench":
+        args = argparse.Namespace(command="bench", bench_args=list(argv[1:]))
+    else:
+        args = parser.parse_args(argv)
+    return args
+
+
+def _shard_result(future):
+    with span("shard_wait"):
+        return future.result()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "compile":
+        return compile_files(args)
+    if args.command == "validate":
+        return validate(args)
+    if args.command == "bench":
+        import bench
+
+        return bench.main(args.bench_args)
+
+    if args.watch:
+        return watch(args)
+    if not args.profile:
+        return run(args)
+
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    with StageTimer() as timer:
+        profiler.enable()
+        try:
+            status = run(args)
+        finally:
+            profiler.disable()
+
+    print("\nStage timings:")
+    print(timer.format())
+    print("\nTop functions (main thread):")
+    pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+    if args.profile_output:
+        profiler.dump_stats(args.profile_output)
+        print(f"cProfile stats written to {args.profile_output}")
+    return status
+
+
+def watch(args):
+    """Rebuild whenever the config file changes; the manifest limits each run to what changed."""
+    last_seen = None
+    try:
+        while True:
+            try:
+                modified = os.stat(args.config).st_mtime_ns
+            except FileNotFoundError:
+                modified = None
+            if modified != last_seen:
+                last_seen = modified
+                if modified is None:
+                    print(f"Waiting for {args.config}...")
+                else:
+                    run(args)
+                    print(f"Watching {args.config} for changes (Ctrl+C to stop)...")
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        return 0
+
+
+def generation_key(gen_config, renderer, compile_config):
+    """Hash of everything that determines one generation's output file."""
+    settings = {"generation": gen_config}
+    if gen_config.get("output", "worksheet.tex").endswith(".pdf"):
+        settings["renderer"] = renderer
+        if renderer != "native":
+            settings["compile"] = compile_config or {}
+    return config_hash(settings)
+
+
+def run(args):
+    """Generate every output configured in config.yaml that is not already up to date."""
+    config_data = load_config(args.config)
+    if config_data is None:
+        return 1
 
     if "generations" not in config_data:
-        print("Error: 'generations' key not found in config.yaml")
-        return
+        print(f"Error: 'generations' key not found in {args.config}")
+        return 1
 
-    for gen_config in config_data["generations"]:
+    default_renderer = args.renderer or config_data.get("renderer", "latex")
+    jobs = args.jobs or config_data.get("jobs", 1)
+
+    # Plan every generation up front: seeds are resolved here so sharded
+    # output is identical to the serial path
+    manifest = BuildManifest()
+    built = {}
+    plans = []
+    for index, gen_config in enumerate(config_data["generations"]):
+        # A top-level seed gives every generation its own independent stream
+        if "seed" in config_data:
+            gen_config.setdefault("seed", config_data["seed"])
+            gen_config.setdefault("stream", index)
         output_file = gen_config.get("output", "worksheet.tex")
+        renderer = args.renderer or gen_config.get("renderer", default_renderer)
+        native = output_file.endswith(".pdf") and renderer == "native"
+        key = generation_key(gen_config, renderer, config_data.get("compile"))
+        try:
+            # The separate answer key is written and tracked as an output of its own
+            outputs = [output_file]
+            if answer_key_mode(gen_config) == "separate":
+                outputs.append(answer_key_output(output_file))
+            # Only a configured seed makes the output reproducible; without one
+            # every run draws new problems, so there is nothing to skip
+            if not args.force and gen_config.get("seed") is not None and \
+                    all(manifest.is_current(output, key) for output in outputs):
+                print(f"Up to date: {output_file}")
+                continue
+            seed = resolve_seed(gen_config)
+            ranges = page_ranges(gen_config["n_page"])
+        except (KeyError, ValueError) as e:
+            print(f"Error generating {output_file}: {e}")
+            continue
+        plans.append((gen_config, output_file, native, seed, ranges))
+        for output in outputs:
+            built[output] = (key, seed)
+
+    # Only load a compile backend when some output actually needs compiling
+    backend = None
+    if any(output_file.endswith(".pdf") and not native for _, output_file, native, _, _ in plans):
+        from tex_compiler import create_backend
+
+        try:
+            backend = create_backend(config_data.get("compile"))
+        except ValueError as exc:
+            print(f"Error in compile settings: {exc}")
+            return 1
+
+    # With the page cache, PDFs are compiled page by page and need each page on its own
+    paged = bool((config_data.get("compile") or {}).get("page_cache"))
+    if paged and not has_pypdf():
+        print("pypdf is not installed; compiling whole documents instead of pages")
+        paged = False
+
+    def shard_function(output_file, native):
+        if native:
+            return generate_page_range
+        if paged and output_file.endswith(".pdf"):
+            return render_pages
+        return render_page_range
+
+    def shard_work(gen_config, output_file, native, seed, ranges):
+        function = shard_function(output_file, native)
+        # Rendered shards bring the answer key pages of their own problems along
+        answer_key = () if native or answer_key_mode(gen_config) is None else (True,)
+        return ((function, (gen_config, seed, start, stop) + answer_key) for start, stop in ranges)
+
+    # Shard every generation's pages into work items consumed in order below
+    work = (item for plan in plans for item in shard_work(*plan))
+    executor = None
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor = ProcessPoolExecutor(max_workers=jobs)
+    shards = iter_shards(work, executor, window=2 * jobs)
+
+    # Write .tex outputs right away and collect PDFs to compile concurrently
+    pdf_jobs = []
+    for gen_config, output_file, native, seed, ranges in plans:
         print(f"Generating {output_file}...")
+        futures = itertools.islice(shards, len(ranges))
+        chunks = (_shard_result(future) for future in futures)
         
         try:
-            latex_code = generate_latex(gen_config)
-            
+            key_mode = answer_key_mode(gen_config)
+            key_output = answer_key_output(output_file) if key_mode == "separate" else None
+            if native:
+                from native_pdf import write_pdf
+                with open(output_file, "wb") as f, \
+                        (open(key_output, "wb") if key_output else nullcontext()) as key_f:
+                    write_pdf(gen_config, f, pages=itertools.chain.from_iterable(chunks), key_fp=key_f)
+                for output in (output_file, key_output):
+                    if output:
+                        manifest.record(output, *built[output])
+                        print(f"  - PDF generated: {output} (native renderer)")
+                print_summary(gen_config)
+                continue
+
+            paged_pdf = paged and output_file.endswith(".pdf")
+            key_chunks = None
+            if key_mode is not None and not paged_pdf:
+                # Key pages wait in a spool file while the worksheet streams
+                spool = _key_spool()
+                chunks = _spool_key_chunks(chunks, spool)
+                key_chunks = _iter_spool(spool)
+
             if output_file.endswith(".pdf"):
-                print(f"  - Compiling {output_file} via TeXLive.net...")
-                success, result = compile_tex_with_texlivenet(latex_code)
-                if success:
-                    with open(output_file, "wb") as f:
-                        f.write(result)
-                    print(f"  - PDF generated: {output_file}")
+                if paged:
+                    pages, key_pages = [], []
+                    for chunk in chunks:
+                        chunk_pages, chunk_key_pages = chunk if key_mode else (chunk, [])
+                        pages += chunk_pages
+                        key_pages += chunk_key_pages
+                    if key_mode == "pages":
+                        pages += key_pages
+                    pdf_jobs.append((gen_config, output_file, pages))
                 else:
-                    print(f"  - Error compiling PDF: {result}")
-            else:
-                with open(output_file, "w", encoding="utf-8") as f:
-                    f.write(latex_code)
-                print(f"  - LaTeX generated: {output_file}")
+                    pdf_jobs.append((gen_config, output_file,
+                                     generate_latex(gen_config, page_chunks=chunks, key_chunks=key_chunks)))
+                # The key goes right after its worksheet, so a batched compile takes both
+                if key_output:
+                    key_tex = key_pages if paged else "".join(iter_answer_key(gen_config, key_chunks=key_chunks))
+                    pdf_jobs.append((gen_config, key_output, key_tex))
+                continue
 
-            print(f"  - Pages: {gen_config.get('n_page')}")
-            print(f"  - Start Page: {gen_config.get('page_offset')}")
-            print("  - Done.")
+            # Stream page by page so memory stays flat for large n_page
+            with open(output_file, "w", encoding="utf-8") as f:
+                write_latex(gen_config, f, page_chunks=chunks, key_chunks=key_chunks)
+            manifest.record(output_file, *built[output_file])
+            print(f"  - LaTeX generated: {output_file}")
+            if key_output:
+                with open(key_output, "w", encoding="utf-8") as f:
+                    write_answer_key(gen_config, f, key_chunks=key_chunks)
+                manifest.record(key_output, *built[key_output])
+                print(f"  - LaTeX generated: {key_output}")
+            print_summary(gen_config)
             
         except Exception as e:
             print(f"Error generating {output_file}: {e}")
+        finally:
+            # Skip whatever this generation did not consume, keeping shards aligned
+            for _ in futures:
+                pass
+
+    if executor is not None:
+        executor.shutdown()
+
+    if pdf_jobs:
+        for output_file in compile_outputs(backend, config_data.get("compile"), pdf_jobs, paged):
+            manifest.record(output_file, *built[output_file])
+    if backend is not None:
+        backend.close()
+
+    if built:
+        try:
+            manifest.save()
+        except OSError as e:
+            print(f"Error writing build manifest {manifest.path}: {e}")
+    return 0
+
+
+def has_pypdf():
+    """True if pypdf, which splits and assembles compiled PDFs, can be imported."""
+    from importlib.util import find_spec
+
+    return find_spec("pypdf") is not None
+
+
+def compile_outputs(backend, compile_config, pdf_jobs, paged=False):
+    """
+    Compile [(gen_config or None, output_file, tex)] concurrently and write the
+    PDFs. With paged, tex is instead the list of each page's LaTeX, and pages
+    are compiled (and cached) one by one, then assembled. Returns the output
+    files written successfully.
+    """
+    from tex_compiler import DEFAULT_MAX_PARALLEL, iter_compile_to_files
+
+    compile_config = compile_config or {}
+    max_parallel = compile_config.get("max_parallel", DEFAULT_MAX_PARALLEL)
+    batch_size = compile_config.get("batch", 0)
+    tex_contents = [latex_code for _, _, latex_code in pdf_jobs]
+    if batch_size > 1 and not has_pypdf():
+        print("pypdf is not installed; compiling without batching")
+        batch_size = 0
+
+    if paged:
+        from page_assembly import iter_compile_paged
+
+        n_pages = sum(len(pages) for pages in tex_contents)
+        print(f"Compiling {len(pdf_jobs)} PDF(s) page by page ({n_pages} pages) via {backend.name}...")
+        documents = [(pages, gen_config["page_offset"]) for gen_config, _, pages in pdf_jobs]
+        results = iter_compile_paged(backend, documents, batch_size, max_parallel)
+    elif batch_size > 1 and len(pdf_jobs) > 1:
+        from pdf_batch import iter_compile_batched
+
+        n_batches = -(-len(pdf_jobs) // batch_size)
+        print(f"Compiling {len(pdf_jobs)} PDF(s) in {n_batches} batch(es) via {backend.name}...")
+        page_counts = [page_count(gen_config) if gen_config else None for gen_config, _, _ in pdf_jobs]
+        results = iter_compile_batched(backend, tex_contents, page_counts, batch_size, max_parallel)
+    else:
+        print(f"Compiling {len(pdf_jobs)} PDF(s) via {backend.name}...")
+        # Written straight to the output files as they arrive
+        results = iter_compile_to_files(backend, [(tex, output_file) for _, output_file, tex in pdf_jobs],
+                                        max_parallel)
+    written = []
+    for index, (success, result) in results:
+        gen_config, output_file, _ = pdf_jobs[index]
+        if not success:
+            print(f"  - Error compiling {output_file}: {result}")
+            continue
+        try:
+            if result is not None:
+                with open(output_file, "wb") as f:
+                    f.write(result)
+        except OSError as e:
+            print(f"Error writing {output_file}: {e}")
+            continue
+        written.append(output_file)
+        print(f"  - PDF generated: {output_file}")
+        if gen_config is not None:
+            print_summary(gen_config)
+
+    cache = getattr(backend, "cache", None)
+    if cache is not None:
+        stats = cache.stats()
+        if stats["hits"] or stats["misses"]:
+            print(f"Compile cache: {stats['hits']} hits, {stats['misses']} misses")
+    return written
+
+
+def compile_files(args):
+    """The `compile` command: turn existing .tex files into PDFs."""
+    from tex_compiler import create_backend
+
+    if args.output and len(args.tex_files) > 1:
+        print("Error: --output needs exactly one input file")
+        return 2
+
+    compile_config = {}
+    if os.path.exists(args.config):
+        config_data = load_config(args.config)
+        if config_data is None:
+            return 1
+        compile_config = dict(config_data.get("compile") or {})
+    if args.backend:
+        compile_config["backend"] = args.backend
+
+    pdf_jobs = []
+    for tex_file in args.tex_files:
+        try:
+            with open(tex_file, "r", encoding="utf-8") as f:
+                tex_content = f.read()
+        except OSError as e:
+            print(f"Error reading {tex_file}: {e}")
+            return 1
+        output_file = args.output or os.path.splitext(tex_file)[0] + ".pdf"
+        pdf_jobs.append((None, output_file, tex_content))
+
+    try:
+        backend = create_backend(compile_config)
+    except ValueError as exc:
+        print(f"Error in compile settings: {exc}")
+        return 1
+    try:
+        written = compile_outputs(backend, compile_config, pdf_jobs)
+    finally:
+        backend.close()
+    return 0 if len(written) == len(pdf_jobs) else 1
+
+
+def check_generation(gen_config, max_questions=None, max_digits=None):
+    """
+    Check one generation's settings by generating its first page.
+    Raises ValueError (or KeyError/TypeError for malformed problems) if invalid.
+    With max_questions and max_digits, pages with more questions and operands
+    or carry/borrow limits over max_digits are rejected before any are generated.
+    """
+    if not isinstance(gen_config.get("n_page"), int) or gen_config["n_page"] < 1:
+        raise ValueError("n_page must be a positive integer")
+    if not isinstance(gen_config.get("page_offset"), int):
+        raise ValueError("page_offset must be an integer")
+    if not isinstance(gen_config.get("problems"), list) or not gen_config["problems"]:
+        raise ValueError("problems must be a non-empty list")
+    for problem in gen_config["problems"]:
+        if problem.get("type", "addition") not in OPERATIONS:
+            raise ValueError(f"unknown problem type {problem['type']!r}")
+        if max_digits is not None:
+            operands = problem.get("operands", [1, 1])
+            if not isinstance(operands, list) or len(operands) != 2 or \
+                    not all(type(digits) is int and 1 <= digits <= max_digits for digits in operands):
+                raise ValueError(f"operands must be two digit counts from 1 to {max_digits} (got {operands!r})")
+            limits = carry_limits(problem)
+            if limits is not None and limits[1] is not None and limits[1] > max_digits:
+                option = CARRY_OPTIONS[problem.get("type", "addition")]
+                raise ValueError(f"{option} must be at most {max_digits} columns (got {problem[option]!r})")
+    answer_key_mode(gen_config)
+    if max_questions is not None:
+        _, total_questions = question_count(gen_config)
+        if not isinstance(total_questions, int) or total_questions > max_questions:
+            raise ValueError(f"at most {max_questions} questions per page are allowed (got {total_questions})")
+    generate_page(gen_config, 0, resolve_seed(gen_config))
+
+
+def validate(args):
+    """
+    The `validate` command: check every generation in the config by planning
+    it and generating its first page, without writing any output.
+    """
+    config_data = load_config(args.config)
+    if config_data is None:
+        return 1
+    errors = []
+    generations = config_data.get("generations")
+    if not isinstance(generations, list) or not generations:
+        errors.append("'generations' must be a non-empty list")
+        generations = []
+
+    for index, gen_config in enumerate(generations):
+        output_file = gen_config.get("output", "worksheet.tex")
+        if not output_file.endswith((".tex", ".pdf")):
+            errors.append(f"{output_file}: output must end in .tex or .pdf")
+        renderer = gen_config.get("renderer", config_data.get("renderer", "latex"))
+        if renderer not in RENDERERS:
+            errors.append(f"{output_file}: unknown renderer {renderer!r}")
+        try:
+            gen_config = dict(gen_config)
+            if "seed" in config_data:
+                gen_config.setdefault("seed", config_data["seed"])
+                gen_config.setdefault("stream", index)
+            check_generation(gen_config)
+        except Exception as e:
+            errors.append(f"{output_file}: {e}")
+
+    compile_config = config_data.get("compile") or {}
+    if compile_config:
+        from tex_compiler import BACKENDS
+
+        fallback = compile_config.get("fallback", [])
+        names = [compile_config.get("backend", "texlivenet")]
+        names += [fallback] if isinstance(fallback, str) else list(fallback)
+        for name in names:
+            if name not in BACKENDS:
+                errors.append(f"compile: unknown backend {name!r} (choose from {', '.join(BACKENDS)})")
+
+    for error in errors:
+        print(f"Error: {error}")
+    if errors:
+        return 1
+    print(f"{args.config}: {len(generations)} generation(s) OK")
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
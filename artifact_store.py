@@ -0,0 +1,133 @@
+"""
+Disk-backed store for generated worksheet files.
+
+The web app keeps generated LaTeX, PDFs and download archives here instead of
+in memory, so a session only holds file paths and memory use no longer grows
+with the size or number of worksheets. The store has two areas:
+
+    shared/<key[:2]>/<key><suffix>   content keyed by config hash, reused by every session
+    sessions/<session id>/<name>     the files one session offers for download
+
+Session files are hard links to shared entries where possible, so sharing
+costs no extra space and evicting a shared entry never breaks a download.
+Shared entries and session directories unused for ttl seconds are removed by
+sweep(), which callers may run as often as they like.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+
+from profiling import span
+from tex_compiler import atomic_output
+
+
+DEFAULT_STORE_DIR = os.path.join(tempfile.gettempdir(), "arithmetic_generator", "artifacts")
+DEFAULT_STORE_TTL = 60 * 60  # seconds
+# sweep() walks the store at most this often
+SWEEP_INTERVAL = 60  # seconds
+
+
+class ArtifactStore:
+    """Shared, content-keyed artifacts plus per-session download directories, with TTL eviction."""
+
+    def __init__(self, directory=DEFAULT_STORE_DIR, ttl=DEFAULT_STORE_TTL):
+        self.directory = os.path.expanduser(directory)
+        self.ttl = ttl
+        self._shared = os.path.join(self.directory, "shared")
+        self._sessions = os.path.join(self.directory, "sessions")
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(self._shared, exist_ok=True)
+        os.makedirs(self._sessions, exist_ok=True)
+
+    def shared_path(self, key, suffix):
+        """Path of the shared entry for key; its directory exists, the file may not."""
+        directory = os.path.join(self._shared, key[:2])
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, key + suffix)
+
+    def lookup(self, key, suffix):
+        """Return the path of the shared entry for key, or None if there is none."""
+        path = self.shared_path(key, suffix)
+        try:
+            # Touch the entry so sweep() sees it as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def session_dir(self, session_id):
+        """Directory holding a session's downloads, created if needed."""
+        directory = os.path.join(self._sessions, session_id)
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def session_path(self, session_id, filename):
+        return os.path.join(self.session_dir(session_id), filename)
+
+    def link(self, path, session_id, filename):
+        """Make the file at path available to a session as filename. Returns the new path."""
+        dest = self.session_path(session_id, filename)
+        tmp_path = f"{dest}.{threading.get_ident()}.link"
+        try:
+            os.link(path, tmp_path)
+        except OSError:
+            # No hard links on this file system: copy instead
+            with open(path, "rb") as src, atomic_output(dest) as f:
+                shutil.copyfileobj(src, f)
+            return dest
+        os.replace(tmp_path, dest)
+        return dest
+
+    def clear_session(self, session_id):
+        """Remove a session's previous downloads."""
+        shutil.rmtree(os.path.join(self._sessions, session_id), ignore_errors=True)
+
+    def touch(self, session_id):
+        """Mark a session as in use. Returns False if its files have expired."""
+        try:
+            os.utime(os.path.join(self._sessions, session_id))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def sweep(self, force=False):
+        """Remove shared entries and sessions unused for ttl seconds, at most every SWEEP_INTERVAL."""
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_sweep < SWEEP_INTERVAL:
+                return
+            self._last_sweep = now
+        cutoff = now - self.ttl
+
+        for root, _, files in os.walk(self._shared):
+            for filename in files:
+                path = os.path.join(root, filename)
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+        for entry in os.scandir(self._sessions):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except FileNotFoundError:
+                pass
+
+
+def create_zip_from_files(file_dict, output_path):
+    """
+    Write a zip file of {filename: path} to output_path, streaming each file in.
+
+    PDFs are already compressed, so they are stored as-is.
+    """
+    with span("zip"), atomic_output(output_path) as f, zipfile.ZipFile(f, "w") as zip_file:
+        for filename, path in file_dict.items():
+            compression = zipfile.ZIP_STORED if filename.endswith(".pdf") else zipfile.ZIP_DEFLATED
+            zip_file.write(path, filename, compress_type=compression)
+    return output_path
@@ -0,0 +1,377 @@
+"""
+Benchmark suite for worksheet generation, rendering and compiling.
+
+Sweeps page counts, questions per page, problem mixes and digit counts and
+reports problems/s, bytes/s, peak memory and p50/p99 latency. Compile
+benchmarks run against a local mock TeXLive.net endpoint. Results are saved
+as JSON so they can be compared between commits:
+
+    python bench.py --output baseline.json
+    python bench.py --compare baseline.json
+
+Every run also checks CLI startup: `generate` to .tex in a fresh interpreter
+must stay within an import-time budget and must not load the compile stack.
+`python bench.py --startup-only` runs just that check.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from arithmetic_generator import generate_worksheet, iter_latex
+from mock_texlive import start_mock_server
+from native_pdf import write_pdf
+from tex_compiler import TeXLiveNetBackend, iter_compile
+
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "arithmetic_generator.py")
+
+# Modules the `generate` path to .tex must never import
+STARTUP_FORBIDDEN = ("requests", "urllib3", "tex_compiler", "pypdf", "streamlit", "multiprocessing", "cProfile")
+# Seconds of module imports allowed for `generate` to .tex
+DEFAULT_IMPORT_BUDGET = 0.4
+
+STARTUP_CONFIG = """\
+generations:
+  - output: startup.tex
+    n_page: 1
+    page_offset: 1
+    problems:
+      - type: addition
+        operands: [2, 2]
+        questions_per_page: 20
+"""
+
+MIXES = {
+    "addition": [{"type": "addition"}],
+    "mixed": [
+        {"type": "addition"},
+        {"type": "subtraction", "easymode": True},
+        {"type": "multiplication"},
+        {"type": "division", "easymode": True},
+    ],
+}
+
+
+class _NullWriter(io.RawIOBase):
+    """Count bytes written and throw them away."""
+
+    def __init__(self):
+        self.bytes = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.bytes += len(data.encode("utf-8")) if isinstance(data, str) else len(data)
+        return len(data)
+
+
+def make_config(n_page, questions, mix, digits):
+    """Build a worksheet config for one point of the sweep."""
+    problems = []
+    per_type, extra = divmod(questions, len(MIXES[mix]))
+    for i, problem in enumerate(MIXES[mix]):
+        problems.append(dict(problem, operands=[digits, digits], questions_per_page=per_type + (i < extra)))
+    return {"n_page": n_page, "page_offset": 1, "seed": 1, "problems": problems}
+
+
+def percentile(samples, q):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def measure(fn, repeat):
+    """
+    Run fn repeat times and return (latencies, result of the last run, peak bytes).
+
+    Peak memory is measured in one extra traced run so tracing does not skew timings.
+    """
+    latencies = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return latencies, result, peak
+
+
+def summarize(name, params, latencies, peak, problems=0, nbytes=0):
+    p50 = percentile(latencies, 50)
+    return {
+        "name": name,
+        "params": params,
+        "problems_per_sec": problems / p50 if problems and p50 else None,
+        "bytes_per_sec": nbytes / p50 if nbytes and p50 else None,
+        "peak_kib": peak / 1024,
+        "p50_ms": p50 * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def bench_generation(config, repeat):
+    """Problem generation only."""
+    latencies, _, peak = measure(lambda: generate_worksheet(config), repeat)
+    problems = config["n_page"] * sum(p["questions_per_page"] for p in config["problems"])
+    return latencies, peak, problems, 0
+
+
+def bench_latex(config, repeat):
+    """Generation plus LaTeX rendering, streamed to a null writer."""
+    def run():
+        writer = _NullWriter()
+        for chunk in iter_latex(config):
+            writer.write(chunk)
+        return writer.bytes
+
+    latencies, nbytes, peak = measure(run, repeat)
+    problems = config["n_page"] * sum(p["questions_per_page"] for p in config["problems"])
+    return latencies, peak, problems, nbytes
+
+
+def bench_native_pdf(config, repeat):
+    """Generation plus native PDF rendering."""
+    def run():
+        writer = _NullWriter()
+        write_pdf(config, writer)
+        return writer.bytes
+
+    latencies, nbytes, peak = measure(run, repeat)
+    problems = config["n_page"] * sum(p["questions_per_page"] for p in config["problems"])
+    return latencies, peak, problems, nbytes
+
+
+def bench_zip(n_files, pdf_size, repeat):
+    """Zipping generated PDFs for download."""
+    from artifact_store import create_zip_from_files
+
+    with tempfile.TemporaryDirectory() as directory:
+        files = {}
+        for i in range(n_files):
+            files[f"worksheet_{i}.pdf"] = os.path.join(directory, f"worksheet_{i}.pdf")
+            with open(files[f"worksheet_{i}.pdf"], "wb") as f:
+                f.write(os.urandom(pdf_size))
+        zip_path = os.path.join(directory, "worksheets.zip")
+        latencies, _, peak = measure(lambda: create_zip_from_files(files, zip_path), repeat)
+    return latencies, peak, 0, n_files * pdf_size
+
+
+def bench_compile(url, n_docs, max_parallel, repeat):
+    """Compiling n_docs documents against the mock endpoint, max_parallel at a time."""
+    tex = "".join(iter_latex(make_config(1, 20, "mixed", 2)))
+    backend = TeXLiveNetBackend(url=url, max_connections=max_parallel)
+
+    def run():
+        results = list(iter_compile(backend, [tex] * n_docs, max_parallel))
+        assert all(success for _, (success, _) in results), "mock compile failed"
+
+    latencies, _, peak = measure(run, repeat)
+    backend.close()
+    return latencies, peak, 0, n_docs * len(tex.encode("utf-8"))
+
+
+def _run_generate(directory, *python_flags):
+    return subprocess.run(
+        [sys.executable, *python_flags, SCRIPT, "generate", "--config", "startup.yaml"],
+        cwd=directory,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True
+    )
+
+
+def bench_startup(repeat):
+    """
+    Run `arithmetic_generator.py generate` to .tex in a fresh interpreter.
+
+    Returns (latencies, import seconds, forbidden modules imported); imports are
+    measured in one extra run with -X importtime so they do not skew timings.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "startup.yaml"), "w", encoding="utf-8") as f:
+            f.write(STARTUP_CONFIG)
+
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            _run_generate(directory)
+            latencies.append(time.perf_counter() - start)
+
+        # Lines look like "import time:  self [us] | cumulative | module"
+        stderr = _run_generate(directory, "-X", "importtime").stderr
+        import_us = 0
+        modules = set()
+        for line in stderr.splitlines():
+            fields = line.split("|")
+            if not line.startswith("import time:") or len(fields) != 3 or "self [us]" in line:
+                continue
+            import_us += int(fields[0].split(":")[1])
+            modules.add(fields[2].strip())
+
+    forbidden = [name for name in STARTUP_FORBIDDEN if name in modules]
+    return latencies, import_us / 1e6, forbidden
+
+
+def check_startup(repeat, budget):
+    """Run the startup benchmark; returns (result record, list of budget violations)."""
+    latencies, import_seconds, forbidden = bench_startup(repeat)
+    result = summarize("startup", {"command": "generate", "output": "tex"}, latencies, 0)
+    result["import_ms"] = import_seconds * 1000
+    print(_format_result(result) + f"  imports {import_seconds * 1000:.1f} ms")
+
+    violations = []
+    if import_seconds > budget:
+        violations.append(f"imports took {import_seconds * 1000:.0f} ms, budget is {budget * 1000:.0f} ms")
+    if forbidden:
+        violations.append(f"generate to .tex imported {', '.join(forbidden)}")
+    return result, violations
+
+
+def run_suite(quick=False, repeat=5, latency=0.05):
+    """Run every benchmark in the sweep and return the list of result records."""
+    pages = [1, 10] if quick else [1, 10, 100]
+    questions = [20] if quick else [10, 20, 50]
+    digits = [2] if quick else [1, 3, 5]
+    results = []
+
+    for n_page in pages:
+        for n_questions in questions:
+            for mix in MIXES:
+                for d in digits:
+                    config = make_config(n_page, n_questions, mix, d)
+                    params = {"n_page": n_page, "questions": n_questions, "mix": mix, "digits": d}
+                    for name, bench in (("generation", bench_generation),
+                                        ("latex", bench_latex),
+                                        ("native_pdf", bench_native_pdf)):
+                        latencies, peak, problems, nbytes = bench(config, repeat)
+                        results.append(summarize(name, params, latencies, peak, problems, nbytes))
+                        print(_format_result(results[-1]))
+
+    for n_files in ([5] if quick else [1, 5, 25]):
+        params = {"files": n_files, "pdf_kib": 64}
+        latencies, peak, _, nbytes = bench_zip(n_files, 64 * 1024, repeat)
+        results.append(summarize("zip", params, latencies, peak, nbytes=nbytes))
+        print(_format_result(results[-1]))
+
+    server, url = start_mock_server(latency=latency)
+    try:
+        for n_docs, max_parallel in ([(5, 1), (5, 5)] if quick else [(1, 1), (5, 1), (5, 5), (25, 5)]):
+            params = {"docs": n_docs, "max_parallel": max_parallel, "latency_ms": latency * 1000}
+            latencies, peak, _, nbytes = bench_compile(url, n_docs, max_parallel, repeat)
+            results.append(summarize("compile", params, latencies, peak, nbytes=nbytes))
+            print(_format_result(results[-1]))
+    finally:
+        server.shutdown()
+
+    return results
+
+
+def _format_result(result):
+    params = " ".join(f"{k}={v}" for k, v in result["params"].items())
+    rate = ""
+    if result["problems_per_sec"]:
+        rate += f" {result['problems_per_sec']:,.0f} problems/s"
+    if result["bytes_per_sec"]:
+        rate += f" {result['bytes_per_sec'] / 1e6:,.1f} MB/s"
+    return (f"{result['name']:<11} {params:<45} p50 {result['p50_ms']:8.2f} ms"
+            f"  p99 {result['p99_ms']:8.2f} ms  peak {result['peak_kib']:8.0f} KiB{rate}")
+
+
+def _result_key(result):
+    return result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def compare(results, baseline, threshold):
+    """Print p50 changes against a baseline; returns the number of regressions."""
+    previous = {_result_key(r): r for r in baseline["results"]}
+    regressions = 0
+    for result in results:
+        old = previous.get(_result_key(result))
+        if old is None:
+            continue
+        change = result["p50_ms"] / old["p50_ms"] - 1 if old["p50_ms"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        params = " ".join(f"{k}={v}" for k, v in result["params"].items())
+        print(f"{result['name']:<11} {params:<45} {old['p50_ms']:8.2f} -> {result['p50_ms']:8.2f} ms "
+              f"({change:+.1%}){flag}")
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark worksheet generation, rendering and compiling.")
+    parser.add_argument("--quick", action="store_true", help="Run a reduced sweep")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock compile latency in seconds")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Compare p50 latencies against a saved JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative p50 slowdown reported as a regression (default: 0.10)")
+    parser.add_argument("--import-budget", type=float, default=DEFAULT_IMPORT_BUDGET,
+                        help=f"Import seconds allowed for `generate` to .tex (default: {DEFAULT_IMPORT_BUDGET})")
+    parser.add_argument("--startup-only", action="store_true", help="Only run the CLI startup check")
+    args = parser.parse_args(argv)
+
+    startup, violations = check_startup(args.repeat, args.import_budget)
+    for violation in violations:
+        print(f"STARTUP BUDGET EXCEEDED: {violation}")
+    if args.startup_only:
+        return 1 if violations else 0
+
+    results = [startup] + run_suite(quick=args.quick, repeat=args.repeat, latency=args.latency)
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nComparison with {args.compare} (commit {baseline.get('commit')}):")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{regressions} regression(s) over {args.threshold:.0%}")
+            return 1
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Build manifest for incremental CLI runs.
+
+For every output the manifest records a hash of the settings that produced it,
+the resolved seed and a fingerprint of the written file. An output whose
+settings hash and file fingerprint both still match is up to date and can be
+skipped on the next run.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+
+MANIFEST_FILE = ".arithmetic_build.json"
+MANIFEST_VERSION = 1
+
+
+def file_fingerprint(path):
+    """SHA-256 of a file's contents, or None if it does not exist."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+class BuildManifest:
+    """Outputs built so far, stored as JSON and keyed by output path."""
+
+    def __init__(self, path=MANIFEST_FILE):
+        self.path = path
+        self.entries = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if data.get("version") == MANIFEST_VERSION:
+            self.entries = data.get("outputs", {})
+
+    def is_current(self, output_file, config_key):
+        """True if output_file was built from config_key and has not changed since."""
+        entry = self.entries.get(output_file)
+        if entry is None or entry["config"] != config_key:
+            return False
+        # Cheap size check first, so changed files usually skip the hash
+        try:
+            if os.path.getsize(output_file) != entry["size"]:
+                return False
+        except OSError:
+            return False
+        return file_fingerprint(output_file) == entry["fingerprint"]
+
+    def record(self, output_file, config_key, seed):
+        """Remember that output_file was just written from config_key with seed."""
+        self.entries[output_file] = {
+            "config": config_key,
+            "seed": seed,
+            "size": os.path.getsize(output_file),
+            "fingerprint": file_fingerprint(output_file),
+        }
+
+    def save(self):
+        """Write the manifest atomically next to the outputs."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": MANIFEST_VERSION, "outputs": self.entries}, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
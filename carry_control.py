@@ -0,0 +1,209 @@
+"""
+Carry and borrow control for addition and subtraction problems.
+
+A problem type can limit how many columns carry (addition) or borrow
+(subtraction):
+
+    - type: "addition"
+      operands: [3, 3]
+      carry: "none"        # "none", "required" or a maximum number of columns
+
+Operands are built digit by digit from the least significant column up. For
+every column, per-state tables count how many ways the remaining columns can
+still finish within the limits, so each column's digit pair is drawn with
+exactly the right weight. Every draw satisfies the constraint on the first
+try and the result is uniform over all valid operand pairs.
+"""
+
+import functools
+
+import numpy as np
+
+
+# Problem option that controls each operation
+CARRY_OPTIONS = {"addition": "carry", "subtraction": "borrow"}
+
+# Operand pairs per table beyond which sampling draws positions instead of indices
+_INT64_LIMIT = 1 << 62
+# Operands are built in int64, so at most 18 digits
+MAX_COLUMNS = 18
+# Tables kept for reuse; limits are clamped to the column count, so few are distinct
+_TABLE_CACHE_SIZE = 64
+
+
+def carry_limits(problem_config):
+    """
+    Return (min_events, max_events) for a problem type's carry/borrow option,
+    or None if it has none. max_events is None when there is no upper limit.
+    """
+    p_type = problem_config.get("type", "addition")
+    for option in ("carry", "borrow"):
+        value = problem_config.get(option)
+        if value is None or value == "any":
+            continue
+        if CARRY_OPTIONS.get(p_type) != option:
+            raise ValueError(f"'{option}' does not apply to {p_type} problems")
+        if value == "none":
+            return 0, 0
+        if value == "required":
+            return 1, None
+        if isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+            return 0, value
+        raise ValueError(f'{option} must be "none", "required" or a maximum number of columns (got {value!r})')
+    return None
+
+
+def column_table(problem_config):
+    """The ColumnTable for a problem type with carry/borrow control."""
+    min_events, max_events = carry_limits(problem_config)
+    subtract = problem_config.get("type") == "subtraction"
+    digits_a, digits_b = problem_config.get("operands", [1, 1])
+    if subtract and digits_a < digits_b:
+        if not problem_config.get("easymode", False):
+            raise ValueError("borrow control needs the first operand to have at least as many digits "
+                             "as the second, or easymode")
+        # Easymode puts the larger number first anyway
+        digits_a, digits_b = digits_b, digits_a
+    columns = max(digits_a, digits_b)
+    if min(digits_a, digits_b) < 1 or columns > MAX_COLUMNS:
+        raise ValueError(f"carry/borrow control needs operands of 1 to {MAX_COLUMNS} digits")
+    # Every column carries or borrows at most once, so a larger limit is no limit
+    # (and a larger minimum stays impossible); this keeps the tables small
+    if max_events is not None and max_events >= columns:
+        max_events = None
+    min_events = min(min_events, columns + 1)
+    table = _column_table(subtract, digits_a, digits_b, min_events, max_events)
+    if not table.size:
+        option = CARRY_OPTIONS[problem_config.get("type", "addition")]
+        raise ValueError(f"no {digits_a}- and {digits_b}-digit problems satisfy {option}="
+                         f"{problem_config.get(option)!r}")
+    return table
+
+
+@functools.lru_cache(maxsize=_TABLE_CACHE_SIZE)
+def _column_table(subtract, digits_a, digits_b, min_events, max_events):
+    return ColumnTable(subtract, digits_a, digits_b, min_events, max_events)
+
+
+class ColumnTable:
+    """
+    Digit-by-digit construction tables for one operation, digit counts and
+    carry/borrow limits.
+
+    State while building is (carry or borrow into the column, events so far,
+    capped at the largest limit). counts[i][state, pair] is the number of
+    valid ways to finish columns i+1.. after choosing that digit pair in
+    column i; size is the number of valid operand pairs overall. Subtraction
+    never borrows out of the top column, so a >= b.
+    """
+
+    def __init__(self, subtract, digits_a, digits_b, min_events, max_events):
+        self.columns = max(digits_a, digits_b)
+        cap = max_events if max_events is not None else min_events
+        n_counts = cap + 1
+        n_states = 2 * n_counts
+
+        # After the last column: enough events, and no borrow left over
+        ways = [1 if count >= min_events and not (subtract and carry) else 0
+                for carry, count in (divmod(state, n_counts) for state in range(n_states))]
+
+        self.digits = []
+        self.next_state = []
+        counts = []
+        for column in reversed(range(self.columns)):
+            xs, ys = np.meshgrid(_digit_range(column, digits_a), _digit_range(column, digits_b), indexing="ij")
+            xs, ys = xs.ravel(), ys.ravel()
+            next_state = np.zeros((n_states, len(xs)), dtype=np.int64)
+            column_counts = [[0] * len(xs) for _ in range(n_states)]
+            for state in range(n_states):
+                carry, count = divmod(state, n_counts)
+                for pair, (x, y) in enumerate(zip(xs.tolist(), ys.tolist())):
+                    if subtract:
+                        carry_out = int(x - y - carry < 0)
+                    else:
+                        carry_out = int(x + y + carry >= 10)
+                    new_count = count + carry_out
+                    if max_events is not None and new_count > max_events:
+                        continue
+                    following = carry_out * n_counts + min(new_count, cap)
+                    next_state[state, pair] = following
+                    column_counts[state][pair] = ways[following]
+            ways = [sum(row) for row in column_counts]
+            self.digits.append((xs, ys))
+            self.next_state.append(next_state)
+            counts.append(column_counts)
+
+        self.digits.reverse()
+        self.next_state.reverse()
+        counts.reverse()
+        self.size = ways[0]
+
+        # Cumulative counts per state: exact int64 for indexing when they fit,
+        # normalized floats for plain sampling otherwise
+        if self.size <= _INT64_LIMIT:
+            self.cumulative = [np.cumsum(np.array(c, dtype=np.int64), axis=1) for c in counts]
+        else:
+            self.cumulative = None
+            self.probabilities = []
+            for column_counts in counts:
+                totals = [sum(row) or 1 for row in column_counts]
+                weights = np.array([[count / total for count in row]
+                                    for row, total in zip(column_counts, totals)])
+                cumulative = np.cumsum(weights, axis=1)
+                # Pin each row's end to exactly 1 so rounding can never pick a dead pair
+                self.probabilities.append(cumulative / np.maximum(cumulative[:, -1:], 1e-300))
+
+    def unrank(self, index):
+        """Map indices in [0, size) to distinct operand pairs (a, b), column by column."""
+        index = np.asarray(index, dtype=np.int64).copy()
+        a = np.zeros(len(index), dtype=np.int64)
+        b = np.zeros(len(index), dtype=np.int64)
+        state = np.zeros(len(index), dtype=np.int64)
+        place = 1
+        for column in range(self.columns):
+            xs, ys = self.digits[column]
+            # First pair whose running count passes the index, one search per state
+            pair = _search(self.cumulative[column], state, index)
+            exclusive = self.cumulative[column][state, np.maximum(pair - 1, 0)]
+            index -= np.where(pair > 0, exclusive, 0)
+            a += xs[pair] * place
+            b += ys[pair] * place
+            state = self.next_state[column][state, pair]
+            place *= 10
+        return a, b
+
+    def sample(self, n, rng):
+        """Draw n operand pairs uniformly from all valid pairs."""
+        if self.cumulative is not None:
+            return self.unrank(rng.integers(0, self.size, size=n, dtype=np.int64))
+
+        a = np.zeros(n, dtype=np.int64)
+        b = np.zeros(n, dtype=np.int64)
+        state = np.zeros(n, dtype=np.int64)
+        place = 1
+        for column in range(self.columns):
+            xs, ys = self.digits[column]
+            pair = _search(self.probabilities[column], state, rng.random(n))
+            a += xs[pair] * place
+            b += ys[pair] * place
+            state = self.next_state[column][state, pair]
+            place *= 10
+        return a, b
+
+
+def _search(cumulative, state, values):
+    """For each value, the first pair of its state's cumulative row that exceeds it."""
+    pair = np.empty(len(values), dtype=np.int64)
+    for s in np.unique(state).tolist():
+        selected = state == s
+        pair[selected] = np.searchsorted(cumulative[s], values[selected], side="right")
+    return pair
+
+
+def _digit_range(column, digits):
+    """Digits an operand with the given digit count can have in a column (0 = units)."""
+    if column >= digits:
+        return np.zeros(1, dtype=np.int64)
+    if column == digits - 1:
+        return np.arange(1, 10, dtype=np.int64)
+    return np.arange(10, dtype=np.int64)
@@ -0,0 +1,151 @@
+"""
+Bounded worker pools and a background job queue.
+
+BoundedPool caps how many jobs an executor holds (queued plus running), so
+callers under load are turned away right away instead of piling up in an
+unbounded queue. JobQueue builds on it for work that outlives the request that
+started it, such as worksheet generation in the web app: each job gets an id,
+its status can be polled at any time, and finished jobs are kept for ttl
+seconds so a later page load can still collect the result.
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+DEFAULT_JOB_WORKERS = 4
+DEFAULT_JOB_DEPTH = 32
+DEFAULT_JOB_TTL = 60 * 60  # seconds
+
+
+class QueueFull(Exception):
+    """A worker pool has no room for more jobs."""
+
+
+class BoundedPool:
+    """
+    Executor that admits at most max_pending queued plus running jobs.
+
+    Callers reserve slots for a whole request up front, so a request is either
+    admitted completely or rejected before any of its work starts.
+    """
+
+    def __init__(self, executor, max_pending):
+        self.executor = executor
+        self.max_pending = max_pending
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    def reserve(self, n=1):
+        """Reserve n job slots, or raise QueueFull if they do not fit."""
+        with self._lock:
+            if self._pending + n > self.max_pending:
+                raise QueueFull(f"{self._pending} of {self.max_pending} jobs pending")
+            self._pending += n
+
+    def release(self, n=1):
+        with self._lock:
+            self._pending -= n
+
+    def submit(self, fn, *args):
+        """Run fn in a reserved slot; the slot is released when the job finishes."""
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self.release()
+            raise
+        future.add_done_callback(lambda _: self.release())
+        return future
+
+    def replace(self, broken, factory):
+        """
+        Swap a broken executor for factory(), unless another caller already
+        has. Jobs still reserved keep their slots until they finish or fail.
+        """
+        with self._lock:
+            if self.executor is not broken:
+                return
+            self.executor = factory()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class Job:
+    """State of one background job. status is queued, running, done or failed."""
+
+    __slots__ = ("id", "name", "status", "result", "error", "submitted", "finished")
+
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.submitted = time.monotonic()
+        self.finished = None
+
+    @property
+    def done(self):
+        return self.status in ("done", "failed")
+
+
+class JobQueue:
+    """Fixed pool of worker threads running jobs that can be polled by id."""
+
+    def __init__(self, workers=DEFAULT_JOB_WORKERS, max_depth=DEFAULT_JOB_DEPTH, ttl=DEFAULT_JOB_TTL):
+        self.ttl = ttl
+        self._pool = BoundedPool(ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job"), max_depth)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        """Jobs queued or running right now."""
+        return self._pool.pending
+
+    def submit_many(self, tasks):
+        """
+        Queue [(name, fn, args)] as jobs, all or none. Returns their job ids in
+        order, or raises QueueFull if the queue has no room for all of them.
+        """
+        self._pool.reserve(len(tasks))
+        jobs = [Job(name) for name, _, _ in tasks]
+        with self._lock:
+            self._expire()
+            self._jobs.update((job.id, job) for job in jobs)
+        for job, (_, fn, args) in zip(jobs, tasks):
+            self._pool.submit(self._run, job, fn, args)
+        return [job.id for job in jobs]
+
+    def get(self, job_id):
+        """Return the Job with this id, or None if it is unknown or has expired."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, fn, args):
+        job.status = "running"
+        try:
+            job.result = fn(*args)
+            job.status = "done"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        job.finished = time.monotonic()
+
+    def _expire(self):
+        """Forget finished jobs older than ttl. Caller holds the lock."""
+        cutoff = time.monotonic() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done and job.finished < cutoff]:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        self._pool.shutdown()
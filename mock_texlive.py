@@ -0,0 +1,142 @@
+"""
+Local mock of the TeXLive.net latexcgi endpoint.
+
+Answers every POST with a blank PDF after a configurable delay, so compile
+paths can be benchmarked and exercised offline:
+
+    python mock_texlive.py --port 8765 --latency 0.5
+
+then point the compile backend at it with `compile: {url: "http://127.0.0.1:8765/"}`.
+MockCompileBackend gives the same answers in-process, without HTTP.
+
+Faults can be injected to exercise retries, the circuit breaker and hedging:
+--fail-rate answers a share of requests with 503, --drop-rate closes the
+connection without answering, and --slow-rate adds --slow-latency seconds to
+a share of requests to give the latency a long tail.
+"""
+
+import argparse
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tex_compiler import CompileBackend
+
+
+def mock_pdf(n_pages=1):
+    """Build a minimal valid PDF with n_pages blank A4 pages."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        ("<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            " ".join(f"{3 + i} 0 R" for i in range(n_pages)), n_pages)).encode(),
+    ]
+    objects += [b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595.28 841.89] >>"] * n_pages
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for obj_id, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{obj_id} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+class MockTeXLiveHandler(BaseHTTPRequestHandler):
+    """Reply to latexcgi POSTs with a blank PDF, one page per \\newpage + 1."""
+
+    latency = 0.0
+    jitter = 0.0
+    fail_rate = 0.0
+    drop_rate = 0.0
+    slow_rate = 0.0
+    slow_latency = 0.0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        delay = self.latency + random.uniform(0, self.jitter)
+        if random.random() < self.slow_rate:
+            delay += self.slow_latency
+        time.sleep(delay)
+
+        fault = random.random()
+        if fault < self.drop_rate:
+            self.close_connection = True
+            return
+        if fault < self.drop_rate + self.fail_rate:
+            message = b"Service Unavailable"
+            self.send_response(503)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(message)))
+            self.end_headers()
+            self.wfile.write(message)
+            return
+
+        pdf = mock_pdf(body.count(b"\\newpage") + 1)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(len(pdf)))
+        self.end_headers()
+        self.wfile.write(pdf)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockCompileBackend(CompileBackend):
+    """Compile backend answering with blank PDFs after the mock server's delay."""
+
+    name = "mock"
+
+    def __init__(self, latency=0.0, jitter=0.0):
+        self.latency = latency
+        self.jitter = jitter
+
+    def compile(self, tex_content):
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        return True, mock_pdf(tex_content.count("\\newpage") + 1)
+
+
+def start_mock_server(latency=0.0, jitter=0.0, host="127.0.0.1", port=0, **faults):
+    """
+    Start the mock server on a background thread. faults sets any of
+    fail_rate, drop_rate, slow_rate and slow_latency.
+
+    Returns (server, url); call server.shutdown() when done.
+    """
+    handler = type("Handler", (MockTeXLiveHandler,), {"latency": latency, "jitter": jitter, **faults})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock TeXLive.net latexcgi endpoint.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay of up to this many seconds")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with HTTP 503")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Share of connections closed without an answer")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Share of requests delayed by --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=0.0, help="Extra delay of slow requests in seconds")
+    args = parser.parse_args()
+
+    handler = type("Handler", (MockTeXLiveHandler,), {
+        "latency": args.latency, "jitter": args.jitter, "fail_rate": args.fail_rate,
+        "drop_rate": args.drop_rate, "slow_rate": args.slow_rate, "slow_latency": args.slow_latency,
+    })
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    print(f"Mock TeXLive.net listening on http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
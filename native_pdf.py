@@ -0,0 +1,282 @@
+"""
+Native PDF renderer.
+
+Writes worksheets straight to PDF without LaTeX or a compile step, using the
+same layout as generate_latex: the date line, two columns of numbered problems
+with answer blanks, centered page numbers starting at page_offset and the same
+font-size tiers. Text uses the standard Helvetica font and the HYSMyeongJo
+Korean font that every PDF viewer provides, so nothing has to be embedded.
+"""
+
+import tempfile
+import zlib
+from io import BytesIO
+
+from arithmetic_generator import (
+    ANSWER_KEY_TITLE, KEY_SPOOL_SIZE, OP_DIV, answer_key_mode, check_answer, font_settings, iter_pages,
+    question_count, resolve_seed
+)
+from profiling import span
+
+
+# A4 page in points, 2cm margins and column gap (matching the LaTeX geometry)
+PAGE_WIDTH = 595.28
+PAGE_HEIGHT = 841.89
+MARGIN = 56.69
+COLUMN_GAP = 56.69
+COLUMN_WIDTH = (PAGE_WIDTH - 2 * MARGIN - COLUMN_GAP) / 2
+FOOTER_Y = MARGIN - 30  # \footskip below the text area
+CM = 28.3465
+
+# Font size and baseline skip of each LaTeX size command at 12pt
+FONT_SIZES = {
+    r"\Large": (17.28, 22.0),
+    r"\large": (14.4, 18.0),
+    r"\normalsize": (12.0, 14.5),
+    r"\small": (10.95, 13.6),
+}
+
+# Helvetica glyph widths (1/1000 em) for every character we draw
+HELVETICA_WIDTHS = {" ": 278, ".": 278, ":": 278, "(": 333, ")": 333, "+": 584, "-": 333, "=": 584,
+                    "\x85": 1000, "\xd7": 584, "\xf7": 584}
+HELVETICA_WIDTHS.update({str(d): 556 for d in range(10)})
+
+# Operator symbols in WinAnsiEncoding, indexed by operator code
+PDF_SYMBOLS = ("+", "-", "\xd7", "\xf7")
+
+DATE_LABEL = "날짜"
+PAGE_LABEL = "쪽"
+
+# Fixed objects: catalog, page tree, Helvetica, Korean Type0 font and its parts
+CATALOG_ID, PAGES_ID, HELVETICA_ID, KOREAN_ID, CID_FONT_ID, DESCRIPTOR_ID = range(1, 7)
+FIRST_PAGE_ID = 7
+
+
+def text_width(text, size):
+    """Width of Helvetica text in points."""
+    return sum(HELVETICA_WIDTHS.get(ch, 556) for ch in text) * size / 1000
+
+
+def _text(x, y, text, size):
+    escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return f"BT /F1 {size:.2f} Tf {x:.2f} {y:.2f} Td ({escaped}) Tj ET\n"
+
+
+def _korean_text(x, y, text, size):
+    hex_text = text.encode("utf-16-be").hex().upper()
+    return f"BT /F2 {size:.2f} Tf {x:.2f} {y:.2f} Td <{hex_text}> Tj ET\n"
+
+
+def _line(x1, y1, x2, y2):
+    return f"{x1:.2f} {y1:.2f} m {x2:.2f} {y2:.2f} l S\n"
+
+
+def render_page_content(page_problems, page_number, font_size, v_space, answers_for=None):
+    """
+    Build the content stream for one page. With answers_for, the page is the
+    answer key for that worksheet page number: blanks show the answers.
+    """
+    size, baselineskip = FONT_SIZES[font_size]
+    row_height = baselineskip + float(v_space.rstrip("cm")) * CM
+    parts = ["0.4 w\n"]
+
+    y = PAGE_HEIGHT - MARGIN - 12
+    if answers_for is None:
+        # Date field at top, in the normal 12pt size
+        parts.append(_korean_text(MARGIN, y, DATE_LABEL, 12))
+        x = MARGIN + len(DATE_LABEL) * 12 + text_width(": ", 12)
+        parts.append(_text(MARGIN + len(DATE_LABEL) * 12, y, ":", 12))
+        parts.append(_line(x, y - 2, x + 5 * CM, y - 2))
+    else:
+        # Answer key title with the worksheet page it belongs to
+        parts.append(_korean_text(MARGIN, y, ANSWER_KEY_TITLE, 12))
+        x = MARGIN + len(ANSWER_KEY_TITLE) * 12
+        reference = f" ({answers_for}"
+        parts.append(_text(x, y, reference, 12))
+        x += text_width(reference, 12)
+        parts.append(_korean_text(x, y, PAGE_LABEL, 12))
+        parts.append(_text(x + len(PAGE_LABEL) * 12, y, ")", 12))
+
+    # Two columns like multicols: the first half of the problems on the left
+    top = y - 0.5 * CM - baselineskip
+    half = (len(page_problems) + 1) // 2
+    for index, (op, a, b, answer, remainder) in enumerate(page_problems):
+        column, row = divmod(index, half) if half else (0, 0)
+        x = MARGIN + column * (COLUMN_WIDTH + COLUMN_GAP)
+        y = top - row * row_height
+
+        # Format: numbered problem with blank for answer
+        label = f"{index + 1}."
+        parts.append(_text(x, y, label, size))
+        x += text_width(label, size) + size
+        problem_str = f"{a} {PDF_SYMBOLS[op]} {b} ="
+        parts.append(_text(x, y, problem_str, size))
+        x += text_width(problem_str + " ", size)
+        if answers_for is None:
+            parts.append(_line(x, y - 2, x + 3 * CM, y - 2))
+        else:
+            check_answer(op, a, b, answer, remainder)
+            # Division remainders follow an ellipsis, like the LaTeX answer key
+            answer_str = f"{answer} \x85 {remainder}" if op == OP_DIV and remainder else str(answer)
+            parts.append(_text(x, y, answer_str, size))
+
+    # Centered page number
+    number = str(page_number)
+    parts.append(_text((PAGE_WIDTH - text_width(number, 12)) / 2, FOOTER_Y, number, 12))
+    return "".join(parts).encode("latin-1")
+
+
+class _PDFWriter:
+    """Write PDF objects to a binary file object, recording their offsets."""
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.offsets = {}
+        self.position = 0
+        self.page_ids = []
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data):
+        self.fp.write(data)
+        self.position += len(data)
+
+    def add(self, obj_id, body):
+        self.offsets[obj_id] = self.position
+        self._write(f"{obj_id} 0 obj\n".encode() + body + b"\nendobj\n")
+
+    def add_stream(self, obj_id, data):
+        data = zlib.compress(data)
+        header = f"<< /Length {len(data)} /Filter /FlateDecode >>\nstream\n".encode()
+        self.add(obj_id, header + data + b"\nendstream")
+
+    def finish(self):
+        xref_position = self.position
+        count = max(self.offsets) + 1
+        lines = [f"xref\n0 {count}\n", "0000000000 65535 f \n"]
+        # Unused object numbers are listed as free entries
+        lines.extend(f"{self.offsets[i]:010d} 00000 n \n" if i in self.offsets else "0000000000 65535 f \n"
+                     for i in range(1, count))
+        lines.append(f"trailer\n<< /Size {count} /Root {CATALOG_ID} 0 R >>\nstartxref\n{xref_position}\n%%EOF\n")
+        self._write("".join(lines).encode())
+
+
+def _start_document(fp):
+    """Start a PDF on fp with the shared font objects. Returns its _PDFWriter."""
+    writer = _PDFWriter(fp)
+    writer.add(HELVETICA_ID, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    writer.add(KOREAN_ID, (
+        f"<< /Type /Font /Subtype /Type0 /BaseFont /HYSMyeongJo-Medium-UniKS-UCS2-H "
+        f"/Encoding /UniKS-UCS2-H /DescendantFonts [{CID_FONT_ID} 0 R] >>"
+    ).encode())
+    writer.add(CID_FONT_ID, (
+        f"<< /Type /Font /Subtype /CIDFontType0 /BaseFont /HYSMyeongJo-Medium "
+        f"/CIDSystemInfo << /Registry (Adobe) /Ordering (Korea1) /Supplement 1 >> "
+        f"/FontDescriptor {DESCRIPTOR_ID} 0 R /DW 1000 >>"
+    ).encode())
+    writer.add(DESCRIPTOR_ID, (
+        b"<< /Type /FontDescriptor /FontName /HYSMyeongJo-Medium /Flags 6 "
+        b"/FontBBox [-28 -148 1001 880] /ItalicAngle 0 /Ascent 880 /Descent -148 "
+        b"/CapHeight 880 /StemV 60 >>"
+    ))
+    return writer
+
+
+def _add_page(writer, content):
+    """Add a page with the given content stream after the writer's other pages."""
+    page_id = FIRST_PAGE_ID + 2 * len(writer.page_ids)
+    writer.add_stream(page_id + 1, content)
+    writer.add(page_id, (
+        f"<< /Type /Page /Parent {PAGES_ID} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+        f"/Resources << /Font << /F1 {HELVETICA_ID} 0 R /F2 {KOREAN_ID} 0 R >> >> "
+        f"/Contents {page_id + 1} 0 R >>"
+    ).encode())
+    writer.page_ids.append(page_id)
+
+
+def _finish_document(writer):
+    kids = " ".join(f"{page_id} 0 R" for page_id in writer.page_ids)
+    writer.add(PAGES_ID, f"<< /Type /Pages /Kids [{kids}] /Count {len(writer.page_ids)} >>".encode())
+    writer.add(CATALOG_ID, f"<< /Type /Catalog /Pages {PAGES_ID} 0 R >>".encode())
+    writer.finish()
+
+
+def write_pdf(config, fp, pages=None, key_fp=None, seed=None):
+    """
+    Stream the worksheet as a PDF to a binary file object, one page at a time.
+
+    Answer key pages are made from the same problems in the same pass: with
+    key_fp they are written to it as a second PDF, or else with
+    `answer_key: pages` their content waits in a spool file until the
+    worksheet pages are written, then follows them. Given pages must be the
+    config's n_page pages, as the key pages are numbered after them.
+    """
+    _, total_questions = question_count(config)
+    font_size, v_space = font_settings(total_questions)
+    page_offset = config["page_offset"]
+    if seed is None:
+        seed = resolve_seed(config)
+
+    writer = _start_document(fp)
+    key_writer = _start_document(key_fp) if key_fp is not None else None
+    key_spool = None
+    if key_fp is None and answer_key_mode(config) == "pages":
+        key_spool = tempfile.SpooledTemporaryFile(max_size=KEY_SPOOL_SIZE)
+    for page_num, page_problems in enumerate(iter_pages(config, seed) if pages is None else pages):
+        page_number = page_offset + page_num
+        with span("native_pdf"):
+            _add_page(writer, render_page_content(page_problems, page_number, font_size, v_space))
+            if key_writer is not None:
+                _add_page(key_writer, render_page_content(
+                    page_problems, page_number, font_size, v_space, answers_for=page_number
+                ))
+            if key_spool is not None:
+                content = render_page_content(
+                    page_problems, page_number + config["n_page"], font_size, v_space, answers_for=page_number
+                )
+                # Each content stream is preceded by its length
+                key_spool.write(len(content).to_bytes(4, "big") + content)
+
+    if key_spool is not None:
+        with key_spool:
+            key_spool.seek(0)
+            for length in iter(lambda: key_spool.read(4), b""):
+                with span("native_pdf"):
+                    _add_page(writer, key_spool.read(int.from_bytes(length, "big")))
+
+    _finish_document(writer)
+    if key_writer is not None:
+        _finish_document(key_writer)
+
+
+def render_page_numbers(numbers):
+    """
+    Render a PDF with one otherwise empty page per number, showing the number
+    centered in the footer like the worksheets do. Used to stamp page numbers
+    onto pages compiled without them.
+    """
+    buffer = BytesIO()
+    writer = _PDFWriter(buffer)
+    writer.add(HELVETICA_ID, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    page_ids = []
+    for index, number in enumerate(numbers):
+        page_id = FIRST_PAGE_ID + 2 * index
+        text = str(number)
+        writer.add_stream(page_id + 1, _text((PAGE_WIDTH - text_width(text, 12)) / 2, FOOTER_Y, text, 12).encode())
+        writer.add(page_id, (
+            f"<< /Type /Page /Parent {PAGES_ID} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 {HELVETICA_ID} 0 R >> >> /Contents {page_id + 1} 0 R >>"
+        ).encode())
+        page_ids.append(page_id)
+
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    writer.add(PAGES_ID, f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode())
+    writer.add(CATALOG_ID, f"<< /Type /Catalog /Pages {PAGES_ID} 0 R >>".encode())
+    writer.finish()
+    return buffer.getvalue()
+
+
+def render_pdf(config, pages=None):
+    """Render the worksheet to PDF bytes, with any `answer_key: pages` pages."""
+    buffer = BytesIO()
+    write_pdf(config, buffer, pages)
+    return buffer.getvalue()
@@ -0,0 +1,98 @@
+"""
+Page-level compilation and PDF assembly.
+
+Worksheet pages are independent: each has its own date line and multicols
+block. With `compile: {page_cache: true}` every page is compiled as its own
+document, without a page number, so the compiled page (and its PDF cache key)
+depends only on the page's content. The worksheet PDF is then assembled
+locally by concatenating the page PDFs with pypdf and stamping each page
+with its number. Regenerating one page of a 100-page workbook, or changing
+page_offset, costs at most one page compile; identical pages are compiled
+once.
+
+Page numbers are drawn in Helvetica (see native_pdf.render_page_numbers)
+rather than the document font, and the assembled file carries each page's
+fonts separately, so it is somewhat larger than a single compile.
+"""
+
+from io import BytesIO
+
+from arithmetic_generator import LATEX_FOOTER, LATEX_PREAMBLE
+from profiling import span
+from tex_compiler import DEFAULT_MAX_PARALLEL, iter_compile
+
+
+# The worksheet preamble with the footer left empty; numbers are added at assembly
+PAGE_PREAMBLE = LATEX_PREAMBLE.replace(r"\cfoot{\thepage}", r"\cfoot{}")
+
+
+def page_document(page_latex):
+    """Standalone, unnumbered LaTeX document for one rendered page."""
+    return PAGE_PREAMBLE + page_latex + LATEX_FOOTER
+
+
+def assemble_pdf(page_pdfs, first_page):
+    """Concatenate compiled page PDFs into one document, numbering pages from first_page."""
+    from pypdf import PdfReader, PdfWriter
+
+    from native_pdf import render_page_numbers
+
+    with span("assemble"):
+        pages = [page for pdf in page_pdfs for page in PdfReader(BytesIO(pdf)).pages]
+        numbers = PdfReader(BytesIO(render_page_numbers(range(first_page, first_page + len(pages)))))
+        writer = PdfWriter()
+        for page, number in zip(pages, numbers.pages):
+            page.merge_page(number)
+            writer.add_page(page)
+        buffer = BytesIO()
+        writer.write(buffer)
+        return buffer.getvalue()
+
+
+def iter_compile_paged(backend, documents, batch_size=0, max_workers=DEFAULT_MAX_PARALLEL):
+    """
+    Compile documents given as ([page LaTeX], first page number) page by page.
+
+    Pages are compiled through backend, so a CachedBackend answers every page
+    it has seen before; with batch_size > 1 the remaining pages are batched.
+    Yields (index, (success, pdf_bytes or error message)) per document as soon
+    as all of its pages are done, like tex_compiler.iter_compile.
+    """
+    # Each distinct page is compiled once, however many documents contain it
+    positions = {}
+    for pages, _ in documents:
+        for page_latex in pages:
+            positions.setdefault(page_document(page_latex), len(positions))
+    page_docs = list(positions)
+    needed = [[positions[page_document(page_latex)] for page_latex in pages] for pages, _ in documents]
+    waiting = {}
+    for index, page_positions in enumerate(needed):
+        for position in set(page_positions):
+            waiting.setdefault(position, []).append(index)
+    remaining = [len(set(page_positions)) for page_positions in needed]
+
+    if batch_size > 1:
+        from pdf_batch import iter_compile_batched
+
+        compiled = iter_compile_batched(backend, page_docs, [1] * len(page_docs), batch_size, max_workers)
+    else:
+        compiled = iter_compile(backend, page_docs, max_workers)
+
+    results = [None] * len(page_docs)
+    failed = set()
+    for position, result in compiled:
+        results[position] = result
+        for index in waiting.get(position, ()):
+            remaining[index] -= 1
+            if index in failed:
+                continue
+            success, error = result
+            if not success:
+                failed.add(index)
+                page_number = documents[index][1] + needed[index].index(position)
+                yield index, (False, f"page {page_number}: {error}")
+            elif remaining[index] == 0:
+                try:
+                    yield index, (True, assemble_pdf([results[p][1] for p in needed[index]], documents[index][1]))
+                except Exception as e:
+                    yield index, (False, f"assembling pages failed: {e}")
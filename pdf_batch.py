@@ -0,0 +1,160 @@
+"""
+Batched compilation: several worksheets in one compile round-trip.
+
+Documents that share a preamble are joined into one master document, each
+body starting on a new page. The master is compiled once (one request to
+TeXLive.net, one engine start-up locally) and the resulting PDF is split back
+into one PDF per document by the known page map.
+
+Every worksheet page fits on one PDF page, so a worksheet's page count is its
+n_page; for other documents it is estimated from their \\newpage commands.
+If the compiled master does not have the expected number of pages, or the
+batch fails to compile, its documents are compiled one by one instead, so a
+LaTeX error in one worksheet is reported against that worksheet only.
+
+Splitting needs pypdf, imported only when a batch is actually compiled.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from io import BytesIO
+
+from profiling import run_in_context, span
+from tex_compiler import DEFAULT_MAX_PARALLEL
+
+
+BEGIN_DOCUMENT = "\\begin{document}"
+END_DOCUMENT = "\\end{document}"
+DEFAULT_BATCH_SIZE = 25
+
+
+def split_document(tex_content):
+    """Return (preamble, body) of a LaTeX document, or None if it has no document environment."""
+    start = tex_content.find(BEGIN_DOCUMENT)
+    end = tex_content.rfind(END_DOCUMENT)
+    if start < 0 or end < start:
+        return None
+    return tex_content[:start], tex_content[start + len(BEGIN_DOCUMENT):end]
+
+
+def estimate_pages(tex_content):
+    """Expected page count of a document whose pages are separated by \\newpage."""
+    return tex_content.count("\\newpage") + 1
+
+
+def combine_documents(tex_contents):
+    """
+    Join documents with identical preambles into one master document, each
+    starting on a new page. Returns None if the preambles differ.
+    """
+    parts = [split_document(tex) for tex in tex_contents]
+    if any(part is None for part in parts) or len({preamble for preamble, _ in parts}) != 1:
+        return None
+    bodies = "\n\\newpage\n".join(body for _, body in parts)
+    return f"{parts[0][0]}{BEGIN_DOCUMENT}{bodies}{END_DOCUMENT}\n"
+
+
+def split_pdf(pdf_bytes, page_counts):
+    """
+    Split a PDF into consecutive page ranges of the given lengths.
+    Returns a list of PDF bytes, or None if the page total does not match.
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(BytesIO(pdf_bytes))
+    if len(reader.pages) != sum(page_counts):
+        return None
+    outputs = []
+    start = 0
+    for count in page_counts:
+        writer = PdfWriter()
+        for page in reader.pages[start:start + count]:
+            writer.add_page(page)
+        buffer = BytesIO()
+        writer.write(buffer)
+        outputs.append(buffer.getvalue())
+        start += count
+    return outputs
+
+
+def compile_batch(backend, tex_contents, page_counts=None):
+    """
+    Compile documents in a single round-trip where possible.
+
+    page_counts gives each document's expected number of pages (None to
+    estimate). Returns [(success, pdf_bytes or error message)] in input order.
+    PDFs already in the backend's cache are reused and new ones are stored.
+    """
+    if page_counts is None:
+        page_counts = [None] * len(tex_contents)
+    page_counts = [count or estimate_pages(tex) for tex, count in zip(tex_contents, page_counts)]
+
+    # A CachedBackend answers known documents; only the misses go into the batch
+    cache = getattr(backend, "cache", None)
+    compiler = backend.backend if cache is not None else backend
+    results = [None] * len(tex_contents)
+    keys = [None] * len(tex_contents)
+    if cache is not None:
+        with span("cache"):
+            for index, tex in enumerate(tex_contents):
+                keys[index] = cache.key(tex, compiler.cache_key())
+                pdf = cache.get(keys[index])
+                if pdf is not None:
+                    results[index] = (True, pdf)
+    pending = [index for index, result in enumerate(results) if result is None]
+
+    pdfs = None
+    if len(pending) > 1:
+        master = combine_documents([tex_contents[index] for index in pending])
+        if master is not None:
+            success, result = compiler.compile(master)
+            if success:
+                try:
+                    with span("split_pdf"):
+                        pdfs = split_pdf(result, [page_counts[index] for index in pending])
+                except Exception:
+                    pdfs = None
+
+    for position, index in enumerate(pending):
+        if pdfs is not None:
+            results[index] = (True, pdfs[position])
+        else:
+            # No batch result to split: compile this document on its own
+            results[index] = compiler.compile(tex_contents[index])
+        success, result = results[index]
+        if success and cache is not None:
+            cache.put(keys[index], result)
+    return results
+
+
+def _timed_batch(backend, tex_contents, page_counts):
+    with span("compile"):
+        return compile_batch(backend, tex_contents, page_counts)
+
+
+def iter_compile_batched(backend, tex_contents, page_counts=None, batch_size=DEFAULT_BATCH_SIZE,
+                         max_workers=DEFAULT_MAX_PARALLEL):
+    """
+    Compile documents in batches of up to batch_size, several batches at a time.
+
+    Yields (index, (success, result)) per document as each batch finishes,
+    like tex_compiler.iter_compile.
+    """
+    if page_counts is None:
+        page_counts = [None] * len(tex_contents)
+    batches = [range(start, min(start + batch_size, len(tex_contents)))
+               for start in range(0, len(tex_contents), max(1, batch_size))]
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="compile") as executor:
+        futures = {
+            executor.submit(run_in_context(_timed_batch), backend,
+                            [tex_contents[index] for index in batch],
+                            [page_counts[index] for index in batch]): batch
+            for batch in batches
+        }
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                results = [(False, str(e))] * len(batch)
+            for index, result in zip(batch, results):
+                yield index, result
@@ -0,0 +1,178 @@
+"""
+Content-addressed on-disk cache for compiled PDFs.
+
+Entries are keyed by a hash of the LaTeX source and the compile backend, so
+identical input never has to be compiled twice. The cache is bounded in size
+and evicts the least recently used entries first.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+
+from profiling import span
+from tex_compiler import CompileBackend, atomic_output
+
+
+DEFAULT_CACHE_DIR = os.path.join("~", ".cache", "arithmetic_generator", "pdf")
+DEFAULT_MAX_MB = 500
+
+
+class PDFCache:
+    """
+    On-disk PDF cache with a size cap and LRU eviction.
+
+    Writes go to a temp file in the cache directory and are renamed into place,
+    so concurrent writers (threads or processes) never expose partial files.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._size = sum(size for _, _, size in self._entries())
+
+    @staticmethod
+    def key(tex_content, backend_key=""):
+        """Return the cache key for LaTeX content compiled by the given backend."""
+        digest = hashlib.sha256()
+        digest.update(backend_key.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(tex_content.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".pdf")
+
+    def _entries(self):
+        """Yield (path, mtime, size) for every cached PDF."""
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                if not filename.endswith(".pdf"):
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def get(self, key):
+        """Return the cached PDF bytes, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Touch the entry so eviction sees it as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def get_file(self, key, dest):
+        """Copy the cached PDF to dest. Returns False on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as src, atomic_output(dest) as f:
+                shutil.copyfileobj(src, f)
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def put(self, key, pdf_bytes):
+        """Store PDF bytes under key, evicting old entries if over the size cap."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_output(path) as f:
+            f.write(pdf_bytes)
+
+        self._added(len(pdf_bytes))
+
+    def put_file(self, key, pdf_path):
+        """Store a copy of the PDF file at pdf_path under key."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(pdf_path, "rb") as src, atomic_output(path) as f:
+            shutil.copyfileobj(src, f)
+        self._added(os.path.getsize(path))
+
+    def _added(self, size):
+        with self._lock:
+            self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Remove least recently used entries until the cache fits its size cap."""
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        self._size = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+    def stats(self):
+        """Return hit/miss statistics."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "bytes": self._size,
+            }
+
+
+class CachedBackend(CompileBackend):
+    """Compile backend that answers from a PDFCache before compiling."""
+
+    def __init__(self, backend, cache):
+        self.backend = backend
+        self.cache = cache
+        self.name = backend.name
+
+    def cache_key(self):
+        return self.backend.cache_key()
+
+    def compile(self, tex_content):
+        with span("cache"):
+            key = self.cache.key(tex_content, self.backend.cache_key())
+            pdf = self.cache.get(key)
+        if pdf is not None:
+            return True, pdf
+
+        success, result = self.backend.compile(tex_content)
+        if success:
+            self.cache.put(key, result)
+        return success, result
+
+    def compile_to_file(self, tex_content, path):
+        with span("cache"):
+            key = self.cache.key(tex_content, self.backend.cache_key())
+            if self.cache.get_file(key, path):
+                return True, None
+
+        success, error = self.backend.compile_to_file(tex_content, path)
+        if success:
+            self.cache.put_file(key, path)
+        return success, error
+
+    def close(self):
+        self.backend.close()
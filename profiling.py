@@ -0,0 +1,81 @@
+"""
+Lightweight per-stage timing.
+
+Code on the hot path wraps each stage in `span("name")`. Spans cost almost
+nothing unless a StageTimer is active for the current context:
+
+    with StageTimer() as timer:
+        generate_latex(config)
+    print(timer.format())
+
+The active timer follows contextvars, so threads started through
+`run_in_context` (as iter_compile does) report into their caller's timer.
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+
+_active_timer = contextvars.ContextVar("active_timer", default=None)
+
+
+class StageTimer:
+    """Accumulate wall time and call counts per named stage. Thread-safe."""
+
+    def __init__(self):
+        self._totals = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._token = None
+        self._started = None
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self._token = _active_timer.set(self)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self._started
+        _active_timer.reset(self._token)
+        return False
+
+    def add(self, name, seconds):
+        with self._lock:
+            self._totals[name] = self._totals.get(name, 0.0) + seconds
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    def report(self):
+        """Return [(stage, total seconds, calls)] in the order stages were first seen."""
+        with self._lock:
+            return [(name, total, self._counts[name]) for name, total in self._totals.items()]
+
+    def format(self):
+        """Format the stage breakdown as a text table."""
+        lines = [f"{'stage':<20} {'total':>10} {'calls':>7}"]
+        for name, total, calls in self.report():
+            lines.append(f"{name:<20} {total * 1000:>8.1f}ms {calls:>7}")
+        lines.append(f"{'wall time':<20} {self.elapsed * 1000:>8.1f}ms")
+        return "\n".join(lines)
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block as stage `name` in the active timer, if any."""
+    timer = _active_timer.get()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - start)
+
+
+def run_in_context(fn):
+    """Wrap fn so it runs in a copy of the caller's context, e.g. on a worker thread."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
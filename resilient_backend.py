@@ -0,0 +1,238 @@
+"""
+Retries, circuit breaking and hedged requests for remote compile backends.
+
+ResilientBackend wraps a backend whose `attempt` raises TransientError for
+failures worth retrying:
+
+    - Transient failures are retried a bounded number of times, waiting a
+      random delay of up to backoff * 2**n ("full jitter") before retry n + 1,
+      so many clients that failed together do not all retry together.
+    - A circuit breaker counts consecutive transient failures. Past the limit
+      it opens and compiles fail at once (so a FallbackBackend moves on to the
+      next backend) until reset_after seconds pass; then a single probe
+      request decides whether it closes again.
+    - With hedging, a request still running after the p95 of recent latencies
+      gets a second copy, and whichever answers first wins. About one request
+      in twenty is duplicated, while the slowest tail is cut off.
+
+LaTeX errors are answers, not faults: they are neither retried nor counted
+against the breaker.
+"""
+
+import itertools
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from profiling import run_in_context, span
+from tex_compiler import DEFAULT_MAX_PARALLEL, CompileBackend, TransientError
+
+
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.5  # seconds
+MAX_BACKOFF = 10.0
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_AFTER = 30.0  # seconds
+# Latencies kept for the hedge delay, and how many are needed before hedging
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+HEDGE_PERCENTILE = 95
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker over consecutive failures. Thread-safe.
+
+    While open, allow() is False until reset_after seconds have passed; then
+    exactly one caller is let through as a probe.
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_after=DEFAULT_RESET_AFTER):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.state = "closed"
+        self._failures = 0
+        self._opened = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened >= self.reset_after:
+                self.state = "half-open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half-open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened = time.monotonic()
+
+
+class LatencyTracker:
+    """Recent successful request latencies, for the hedge delay. Thread-safe."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent, min_samples=MIN_LATENCY_SAMPLES):
+        """Return the given percentile of recent latencies, or None with too few samples."""
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class ResilientBackend(CompileBackend):
+    """Compile backend adding retries, a circuit breaker and optional hedging to another."""
+
+    def __init__(self, backend, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, breaker=None,
+                 hedge=False, max_parallel=DEFAULT_MAX_PARALLEL):
+        self.backend = backend
+        self.name = backend.name
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker
+        self.latency = LatencyTracker()
+        self.hedges = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        if hedge:
+            self._executor = ThreadPoolExecutor(max_workers=2 * max_parallel, thread_name_prefix="hedge")
+
+    def cache_key(self):
+        return self.backend.cache_key()
+
+    def compile(self, tex_content):
+        return self._call(lambda: self.backend.attempt(tex_content))
+
+    def compile_to_file(self, tex_content, path):
+        # Every attempt, hedged copies included, writes its own part file and
+        # only the winner is moved into place
+        parts = itertools.count()
+
+        def attempt():
+            part = f"{path}.{next(parts)}.part"
+            success, error = self.backend.attempt_to_file(tex_content, part)
+            return success, part if success else error
+
+        success, result = self._call(attempt, discard=_remove_part)
+        if not success:
+            return False, result
+        os.replace(result, path)
+        return True, None
+
+    def _call(self, attempt, discard=None):
+        """Run attempt() with retries, the breaker and hedging. Returns (success, result)."""
+        error = None
+        for retry in range(self.retries + 1):
+            if self.breaker is not None and not self.breaker.allow():
+                return False, f"{self.name} is unavailable (circuit open): {error or 'too many failures'}"
+            if retry:
+                with span("retry_wait"):
+                    time.sleep(random.uniform(0, min(MAX_BACKOFF, self.backoff * 2 ** (retry - 1))))
+            try:
+                result = self._hedged(attempt, discard) if self._executor else self._timed(attempt)
+            except TransientError as e:
+                error = str(e)
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+                continue
+            except Exception as e:
+                if self.breaker is not None:
+                    self.breaker.record_failure()
+                return False, str(e)
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return result
+        return False, error
+
+    def _timed(self, attempt):
+        start = time.perf_counter()
+        result = attempt()
+        self.latency.add(time.perf_counter() - start)
+        return result
+
+    def _hedged(self, attempt, discard=None):
+        """
+        Run one attempt, plus a second one if the first outlasts the p95
+        latency. discard is called with the result of a losing attempt.
+        """
+        primary = self._executor.submit(run_in_context(self._timed), attempt)
+        delay = self.latency.percentile(HEDGE_PERCENTILE)
+        if delay is None or wait([primary], timeout=delay).done:
+            return primary.result()
+
+        with self._lock:
+            self.hedges += 1
+        pending = {primary, self._executor.submit(run_in_context(self._timed), attempt)}
+        # The first answer wins; a transient failure waits for the other request
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((future for future in done if future.exception() is None), None)
+            if winner is None and pending:
+                continue
+            if winner is None:
+                winner = done.pop()
+            if discard is not None:
+                for loser in (done | pending) - {winner}:
+                    loser.add_done_callback(lambda future: future.exception() or discard(future.result()))
+            return winner.result()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self.backend.close()
+
+
+def _remove_part(result):
+    """Delete the part file written by a losing compile_to_file attempt."""
+    success, part = result
+    if success:
+        try:
+            os.remove(part)
+        except FileNotFoundError:
+            pass
+
+
+def create_resilient_backend(backend, compile_config):
+    """Wrap a remote backend as configured in the `compile` section, or return it as is."""
+    retries = compile_config.get("retries", DEFAULT_RETRIES)
+    breaker_config = compile_config.get("circuit_breaker", {})
+    hedge = compile_config.get("hedge", False)
+    if not retries and breaker_config is False and not hedge:
+        return backend
+
+    breaker = None
+    if breaker_config is not False:
+        if breaker_config is True:
+            breaker_config = {}
+        breaker = CircuitBreaker(
+            failure_threshold=breaker_config.get("failures", DEFAULT_FAILURE_THRESHOLD),
+            reset_after=breaker_config.get("reset_after", DEFAULT_RESET_AFTER)
+        )
+    return ResilientBackend(
+        backend,
+        retries=retries,
+        backoff=compile_config.get("backoff", DEFAULT_BACKOFF),
+        breaker=breaker,
+        hedge=hedge,
+        max_parallel=compile_config.get("max_parallel", DEFAULT_MAX_PARALLEL)
+    )
@@ -0,0 +1,402 @@
+"""
+Headless HTTP service for generating worksheets in bulk.
+
+    python service.py --port 8080 --config config.yaml
+    python service.py --port 8080 --mock 0.5      # offline, blank PDFs after 0.5s
+
+Requests carry worksheet configs as JSON, in the same shape as one entry of
+`generations` in config.yaml, or `{"seed": ..., "generations": [...]}`:
+
+    GET  /health                       queue depths and capacity
+    POST /validate                     check configs, answer {"ok": ..., "errors": [...]}
+    POST /worksheet?format=tex|pdf|zip one worksheet as .tex or .pdf, or all as a ZIP
+
+Generation runs on a pool of worker processes and compiles on a pool of
+threads. Each pool admits a bounded number of queued plus running jobs; a
+request that does not fit is answered right away with 429 and Retry-After
+instead of waiting in an unbounded queue. Responses are streamed with chunked
+transfer encoding, and ZIP entries are written as each compile finishes.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from arithmetic_generator import answer_key_mode, check_generation, generate_latex, load_config, resolve_seed
+from job_queue import BoundedPool, QueueFull
+from tex_compiler import create_backend
+
+
+FORMATS = {
+    "tex": "application/x-tex; charset=utf-8",
+    "pdf": "application/pdf",
+    "zip": "application/zip",
+}
+DEFAULT_CPU_WORKERS = os.cpu_count() or 2
+DEFAULT_COMPILE_WORKERS = 8
+# Jobs each pool admits (queued plus running) before answering 429
+DEFAULT_QUEUE_DEPTH = 64
+MAX_BODY_BYTES = 1024 * 1024
+MAX_PAGES = 500
+# Same limits as the web app; page 0 is generated on the handler thread to validate
+MAX_QUESTIONS_PER_PAGE = 50
+MAX_OPERAND_DIGITS = 5
+CHUNK_SIZE = 64 * 1024
+RETRY_AFTER = 1
+
+
+def render_output(gen_config, native):
+    """Worker process job: the worksheet as LaTeX source, or as PDF bytes when native."""
+    if native:
+        from native_pdf import render_pdf
+
+        return render_pdf(gen_config)
+    return generate_latex(gen_config)
+
+
+def plan_request(payload, fmt):
+    """
+    Turn a request body into [(name, gen_config, native)] with every seed resolved.
+    Raises ValueError if any worksheet config is invalid.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("request body must be a JSON object")
+    generations = payload.get("generations", [payload])
+    if not isinstance(generations, list) or not generations:
+        raise ValueError("'generations' must be a non-empty list")
+    if fmt != "zip" and len(generations) != 1:
+        raise ValueError(f"format={fmt} returns one worksheet; use format=zip for several")
+
+    plans = []
+    errors = []
+    for index, gen_config in enumerate(generations):
+        try:
+            if not isinstance(gen_config, dict):
+                raise ValueError("worksheet config must be a JSON object")
+            gen_config = dict(gen_config)
+            # A top-level seed gives every generation its own independent stream
+            if "generations" in payload and "seed" in payload:
+                gen_config.setdefault("seed", payload["seed"])
+                gen_config.setdefault("stream", index)
+            check_generation(gen_config, max_questions=MAX_QUESTIONS_PER_PAGE, max_digits=MAX_OPERAND_DIGITS)
+            if answer_key_mode(gen_config) == "separate":
+                raise ValueError("answer_key: separate is not supported here; use answer_key: pages")
+            if gen_config["n_page"] > MAX_PAGES:
+                raise ValueError(f"n_page must be at most {MAX_PAGES}")
+            gen_config["seed"] = resolve_seed(gen_config)
+        except Exception as e:
+            errors.append(f"worksheet {index + 1}: {e}")
+            continue
+        name = os.path.splitext(os.path.basename(gen_config.get("output") or f"worksheet_{index + 1}"))[0]
+        native = gen_config.get("renderer", payload.get("renderer")) == "native"
+        plans.append((name, gen_config, native))
+    if errors:
+        raise ValueError("; ".join(errors))
+    return plans
+
+
+class ChunkedWriter:
+    """Binary file object writing HTTP/1.1 chunked transfer encoding to a socket file."""
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, data):
+        if data:
+            self.wfile.write(b"%x\r\n" % len(data) + data + b"\r\n")
+        return len(data)
+
+    def flush(self):
+        self.wfile.flush()
+
+    def close(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class WorksheetService:
+    """Worker pools and compile backend shared by every request handler."""
+
+    def __init__(self, backend, cpu_workers=DEFAULT_CPU_WORKERS, compile_workers=DEFAULT_COMPILE_WORKERS,
+                 queue_depth=DEFAULT_QUEUE_DEPTH):
+        self.backend = backend
+        self.cpu_workers = cpu_workers
+        self.cpu = BoundedPool(self._cpu_executor(), queue_depth)
+        self.compile = BoundedPool(
+            ThreadPoolExecutor(max_workers=compile_workers, thread_name_prefix="compile"), queue_depth
+        )
+
+    def _cpu_executor(self):
+        # Workers are started from handler threads while compile threads run, so
+        # they are spawned rather than forked from a multithreaded process
+        return ProcessPoolExecutor(max_workers=self.cpu_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def health(self):
+        return {
+            "status": "ok",
+            "backend": self.backend.name,
+            "cpu": {"pending": self.cpu.pending, "capacity": self.cpu.max_pending},
+            "compile": {"pending": self.compile.pending, "capacity": self.compile.max_pending},
+        }
+
+    def admit(self, plans, fmt):
+        """Reserve every job the request will run, or raise QueueFull."""
+        n_compiles = sum(1 for _, _, native in plans if fmt != "tex" and not native)
+        self.cpu.reserve(len(plans))
+        try:
+            if n_compiles:
+                self.compile.reserve(n_compiles)
+        except QueueFull:
+            self.cpu.release(len(plans))
+            raise
+        return n_compiles
+
+    def run(self, plans, fmt):
+        """
+        Start every job of an admitted request. Returns an iterator of
+        (name, success, data) as each worksheet finishes: tex source, PDF
+        bytes, or an error message.
+
+        Raises BrokenExecutor if the worker processes cannot take jobs, e.g.
+        after one died. The request's reservations are released and the pool
+        is replaced, so later requests get working processes again.
+        """
+        executor = self.cpu.executor
+        renders = []
+        for _, gen_config, native in plans:
+            try:
+                renders.append(self.cpu.submit(render_output, gen_config, fmt != "tex" and native))
+            except BrokenExecutor:
+                # submit released its own slot; the jobs already submitted release theirs as they fail
+                for render in renders:
+                    render.cancel()
+                self.cpu.release(len(plans) - len(renders) - 1)
+                self.compile.release(sum(1 for _, _, native in plans if fmt != "tex" and not native))
+                self.cpu.replace(executor, self._cpu_executor)
+                raise
+        return self._results(plans, fmt, renders, executor)
+
+    def _results(self, plans, fmt, renders, executor):
+        futures = {}
+        for (name, _, native), render in zip(plans, renders):
+            compiles = fmt != "tex" and not native
+            try:
+                output = render.result()
+            except Exception as e:
+                if isinstance(e, BrokenExecutor):
+                    self.cpu.replace(executor, self._cpu_executor)
+                if compiles:
+                    self.compile.release()
+                yield name, False, f"generation failed: {e}"
+                continue
+            if not compiles:
+                yield name, True, output
+                continue
+            try:
+                futures[self.compile.submit(self.backend.compile, output)] = name
+            except Exception as e:
+                yield name, False, f"compile failed: {e}"
+        for future in as_completed(futures):
+            try:
+                success, result = future.result()
+            except Exception as e:
+                success, result = False, str(e)
+            yield futures[future], success, result
+
+    def close(self):
+        self.cpu.shutdown()
+        self.compile.shutdown()
+        self.backend.close()
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """HTTP front end of a WorksheetService."""
+
+    protocol_version = "HTTP/1.1"
+    service = None
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/health":
+            self._send_json(200, self.service.health())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path not in ("/validate", "/worksheet"):
+            self._send_json(404, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        if length > MAX_BODY_BYTES:
+            self._send_json(413, {"error": f"request body over {MAX_BODY_BYTES} bytes"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(length) or b"null")
+        except ValueError as e:
+            self._send_json(400, {"error": f"invalid JSON: {e}"})
+            return
+
+        fmt = parse_qs(url.query).get("format", ["pdf"])[0]
+        if url.path == "/validate":
+            try:
+                plans = plan_request(payload, "zip")
+            except ValueError as e:
+                self._send_json(200, {"ok": False, "errors": str(e).split("; ")})
+                return
+            self._send_json(200, {"ok": True, "seeds": [gen_config["seed"] for _, gen_config, _ in plans]})
+            return
+
+        if fmt not in FORMATS:
+            self._send_json(400, {"error": f"format must be one of {', '.join(FORMATS)}"})
+            return
+        try:
+            plans = plan_request(payload, fmt)
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        try:
+            self.service.admit(plans, fmt)
+        except QueueFull as e:
+            self._send_json(429, {"error": f"server busy: {e}"}, {"Retry-After": str(RETRY_AFTER)})
+            return
+
+        try:
+            results = self.service.run(plans, fmt)
+        except BrokenExecutor as e:
+            self._send_json(503, {"error": f"worker processes failed and were restarted: {e}"},
+                            {"Retry-After": str(RETRY_AFTER)})
+            return
+        try:
+            if fmt == "zip":
+                self._stream_zip(results)
+            else:
+                self._stream_single(plans[0], fmt, results)
+        except ConnectionError:
+            self.close_connection = True
+        finally:
+            # Drain the remaining results so every reserved slot is released
+            for _ in results:
+                pass
+
+    def _stream_single(self, plan, fmt, results):
+        name, gen_config, _ = plan
+        _, success, data = next(results)
+        if not success:
+            self._send_json(502, {"error": data})
+            return
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        writer = self._start_stream(fmt, f"{name}.{fmt}", {"X-Worksheet-Seed": str(gen_config["seed"])})
+        for start in range(0, len(data), CHUNK_SIZE):
+            writer.write(data[start:start + CHUNK_SIZE])
+        writer.close()
+
+    def _stream_zip(self, results):
+        writer = self._start_stream("zip", "worksheets.zip")
+        errors = []
+        # zipfile falls back to data descriptors on unseekable output, so each
+        # entry goes out as soon as its worksheet is done
+        with zipfile.ZipFile(writer, "w") as zf:
+            for name, success, data in results:
+                if not success:
+                    errors.append(f"{name}: {data}")
+                elif isinstance(data, str):
+                    zf.writestr(f"{name}.tex", data, compress_type=zipfile.ZIP_DEFLATED)
+                else:
+                    zf.writestr(f"{name}.pdf", data, compress_type=zipfile.ZIP_STORED)
+            if errors:
+                zf.writestr("errors.txt", "\n".join(errors) + "\n", compress_type=zipfile.ZIP_DEFLATED)
+        writer.close()
+
+    def _start_stream(self, fmt, filename, headers=None):
+        self.send_response(200)
+        self.send_header("Content-Type", FORMATS[fmt])
+        self.send_header("Content-Disposition", f'attachment; filename="{filename}"')
+        self.send_header("Transfer-Encoding", "chunked")
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        return ChunkedWriter(self.wfile)
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_service(service, host="127.0.0.1", port=0):
+    """
+    Serve a WorksheetService on a background thread.
+
+    Returns (server, url); call server.shutdown() and service.close() when done.
+    """
+    handler = type("Handler", (ServiceHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve worksheet generation over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--config", default="config.yaml", help="YAML file whose `compile` section is used")
+    parser.add_argument("--cpu-workers", type=int, default=DEFAULT_CPU_WORKERS,
+                        help="Worker processes generating worksheets")
+    parser.add_argument("--compile-workers", type=int, default=DEFAULT_COMPILE_WORKERS,
+                        help="Compiles running at the same time")
+    parser.add_argument("--queue-depth", type=int, default=DEFAULT_QUEUE_DEPTH,
+                        help="Jobs each pool admits before answering 429")
+    parser.add_argument("--mock", type=float, metavar="LATENCY",
+                        help="Compile with the offline mock backend, answering after LATENCY seconds")
+    args = parser.parse_args()
+
+    if args.mock is not None:
+        from mock_texlive import MockCompileBackend
+
+        backend = MockCompileBackend(latency=args.mock)
+    else:
+        compile_config = {}
+        if os.path.exists(args.config):
+            config_data = load_config(args.config)
+            if config_data is None:
+                return 1
+            compile_config = config_data.get("compile") or {}
+        try:
+            backend = create_backend(compile_config)
+        except ValueError as exc:
+            print(f"Error in compile settings: {exc}")
+            return 1
+
+    service = WorksheetService(backend, args.cpu_workers, args.compile_workers, args.queue_depth)
+    handler = type("Handler", (ServiceHandler,), {"service": service})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    print(f"Worksheet service listening on http://{args.host}:{args.port}/ (compiling via {backend.name})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,68 @@
+"""Carry/borrow tables checked against brute-force enumeration of every operand pair."""
+
+import numpy as np
+import pytest
+
+from carry_control import carry_limits, column_table
+
+
+def count_events(a, b, subtract):
+    """Columns that carry (or borrow) when adding (subtracting) b to a, and the carry out of the top column."""
+    events = carry = 0
+    while a or b:
+        x, y = a % 10, b % 10
+        carry = int(x - y - carry < 0) if subtract else int(x + y + carry >= 10)
+        events += carry
+        a, b = a // 10, b // 10
+    return events, carry
+
+
+def valid_pairs(problem):
+    """Every operand pair that satisfies the problem's carry/borrow limits."""
+    subtract = problem["type"] == "subtraction"
+    min_events, max_events = carry_limits(problem)
+    digits_a, digits_b = problem["operands"]
+    pairs = set()
+    for a in range(10 ** (digits_a - 1), 10**digits_a):
+        for b in range(10 ** (digits_b - 1), 10**digits_b):
+            events, carry = count_events(a, b, subtract)
+            if subtract and carry:
+                # Subtraction problems never go negative
+                continue
+            if events >= min_events and (max_events is None or events <= max_events):
+                pairs.add((a, b))
+    return pairs
+
+
+@pytest.mark.parametrize("option, value", [
+    ("carry", "none"), ("carry", "required"), ("carry", 1), ("carry", 2),
+    ("borrow", "none"), ("borrow", "required"), ("borrow", 1), ("borrow", 2),
+])
+@pytest.mark.parametrize("operands", [[1, 1], [2, 1], [2, 2], [3, 2]])
+def test_table_matches_brute_force(option, value, operands):
+    problem = {"type": "addition" if option == "carry" else "subtraction", "operands": operands, option: value}
+    expected = valid_pairs(problem)
+    if not expected:
+        with pytest.raises(ValueError):
+            column_table(problem)
+        return
+    table = column_table(problem)
+    assert table.size == len(expected)
+
+    # Unranking every index gives every valid pair exactly once
+    a, b = table.unrank(np.arange(table.size, dtype=np.int64))
+    pairs = list(zip(a.tolist(), b.tolist()))
+    assert len(set(pairs)) == len(pairs)
+    assert set(pairs) == expected
+
+    a, b = table.sample(200, np.random.default_rng(7))
+    assert set(zip(a.tolist(), b.tolist())) <= expected
+
+
+@pytest.mark.parametrize("operands", [[2, 2], [3, 1]])
+def test_limits_beyond_the_column_count(operands):
+    # Every column carries at most once, so a limit of the column count or more is no limit
+    columns = max(operands)
+    unlimited = column_table({"type": "addition", "operands": operands, "carry": columns})
+    assert unlimited.size == 9 * 10 ** (operands[0] - 1) * 9 * 10 ** (operands[1] - 1)
+    assert column_table({"type": "addition", "operands": operands, "carry": 10**6}) is unlimited
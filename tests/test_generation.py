@@ -0,0 +1,119 @@
+"""Problem uniqueness, unranking and random-access page generation."""
+
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from arithmetic_generator import (
+    OP_ADD, PAGES_PER_BLOCK, _feistel_permute, generate_page, generate_page_range, iter_pages, operands_from_index,
+    problem_space_size
+)
+
+
+def make_config(problems, n_page, questions_per_page=None):
+    config = {"n_page": n_page, "page_offset": 1, "problems": problems}
+    if questions_per_page is not None:
+        config["questions_per_page"] = questions_per_page
+    return config
+
+
+def problems_of(pages, op=None):
+    """Every (op, a, b) of the pages, optionally only those with operator code op."""
+    return [(row_op, a, b) for page in pages for row_op, a, b, _, _ in page if op is None or row_op == op]
+
+
+@pytest.mark.parametrize("problem", [
+    {"type": "subtraction", "operands": [1, 1], "easymode": True},
+    {"type": "subtraction", "operands": [2, 2], "easymode": True},
+    {"type": "subtraction", "operands": [2, 1], "easymode": True},
+    {"type": "addition", "operands": [1, 2]},
+])
+def test_unranking_is_a_bijection(problem):
+    size = problem_space_size(problem)
+    a, b = operands_from_index(problem, np.arange(size, dtype=np.int64))
+    low_a, low_b = (10 ** (digits - 1) for digits in problem["operands"])
+    high_a, high_b = (10 ** digits for digits in problem["operands"])
+    if problem["operands"][0] == problem["operands"][1] and problem.get("easymode"):
+        # Easy subtraction counts each unordered pair once, larger operand first
+        expected = {(x, y) for x in range(low_a, high_a) for y in range(low_a, x + 1)}
+    else:
+        expected = {(x, y) for x in range(low_a, high_a) for y in range(low_b, high_b)}
+    pairs = list(zip(a.tolist(), b.tolist()))
+    assert len(pairs) == len(expected) == size
+    assert set(pairs) == expected
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 100, 1000, 4097])
+def test_feistel_permute_is_a_permutation(size):
+    values = _feistel_permute(np.arange(size, dtype=np.int64), size, np.random.default_rng(size))
+    assert sorted(values.tolist()) == list(range(size))
+
+
+def test_page_scope_distinct_until_exhausted():
+    # 81 one-digit additions: a page of 81 uses each once, a page of 100 repeats only after all 81
+    problem = {"type": "addition", "operands": [1, 1], "unique": "page"}
+    for page in iter_pages(make_config([problem], 3, 81), seed=1):
+        assert len(set(problems_of([page]))) == 81
+    for page in iter_pages(make_config([problem], 3, 100), seed=1):
+        rows = problems_of([page])
+        assert len(set(rows[:81])) == 81
+        assert max(Counter(rows).values()) == 2
+
+
+def test_page_scope_distinct_in_large_spaces():
+    problem = {"type": "multiplication", "operands": [3, 3], "unique": "page"}
+    for page in iter_pages(make_config([problem], 2, 60), seed=2):
+        assert len(set(problems_of([page]))) == 60
+
+
+@pytest.mark.parametrize("problem, per_page, n_page", [
+    # 81 problems: nine pages of 9 use the space exactly
+    ({"type": "addition", "operands": [1, 1]}, 9, 9),
+    # 45 problems: four whole pages of 10 fit in each pass
+    ({"type": "subtraction", "operands": [1, 1], "easymode": True}, 10, 4),
+    # 81000 problems, beyond enumeration: a keyed permutation over several blocks
+    ({"type": "addition", "operands": [3, 2]}, 40, 2 * PAGES_PER_BLOCK + 5),
+])
+def test_workbook_scope_distinct_until_exhausted(problem, per_page, n_page):
+    problem = dict(problem, unique="workbook")
+    size = problem_space_size(problem)
+    rows = problems_of(iter_pages(make_config([problem], n_page, per_page), seed=3))
+    assert len(rows) == n_page * per_page <= size
+    assert len(set(rows)) == len(rows)
+
+
+def test_workbook_scope_repeats_only_after_the_space_is_used():
+    problem = {"type": "addition", "operands": [1, 1], "unique": "workbook"}
+    rows = problems_of(iter_pages(make_config([problem], 18, 9), seed=4))
+    assert len(set(rows[:81])) == 81
+    assert set(Counter(rows).values()) == {2}
+
+
+def test_workbook_scope_with_mixed_types():
+    problems = [
+        {"type": "addition", "operands": [1, 1], "unique": "workbook", "questions_per_page": 5},
+        {"type": "multiplication", "operands": [1, 1], "questions_per_page": 7},
+    ]
+    rows = problems_of(iter_pages(make_config(problems, 16), seed=5), op=OP_ADD)
+    assert len(rows) == 80
+    assert len(set(rows)) == 80
+
+
+@pytest.mark.parametrize("problems, questions_per_page", [
+    ([{"type": "addition", "operands": [2, 2]}, {"type": "division", "operands": [2, 1], "easymode": True}], 20),
+    ([{"type": "subtraction", "operands": [2, 2], "easymode": True, "unique": "workbook", "questions_per_page": 8},
+      {"type": "multiplication", "operands": [20, 3], "questions_per_page": 4}], None),
+    ([{"type": "addition", "operands": [3, 3], "carry": 1, "unique": "page"},
+      {"type": "subtraction", "operands": [3, 2], "borrow": "required"}], 12),
+])
+def test_random_access_matches_sequential(problems, questions_per_page):
+    config = make_config(problems, 2 * PAGES_PER_BLOCK + 3, questions_per_page)
+    pages = [problems_of([page]) for page in iter_pages(config, seed=6)]
+    assert len(pages) == config["n_page"]
+    for page_index in reversed(range(config["n_page"])):
+        assert problems_of([generate_page(config, page_index, seed=6)]) == pages[page_index]
+    start, stop = 7, PAGES_PER_BLOCK + 9
+    assert [problems_of([page]) for page in generate_page_range(config, 6, start, stop)] == pages[start:stop]
+    # A page's problems do not depend on how long the worksheet is
+    assert problems_of([generate_page(dict(config, n_page=1), 4, seed=6)]) == pages[4]
@@ -0,0 +1,30 @@
+"""Startup cost of `arithmetic_generator.py generate` when it only writes .tex."""
+
+import os
+import subprocess
+import sys
+
+from bench import DEFAULT_IMPORT_BUDGET, SCRIPT, STARTUP_CONFIG, bench_startup
+
+# Modules a .tex-only run must leave unimported
+HEAVY_MODULES = ("requests", "pypdf", "streamlit")
+
+
+def test_import_time_within_budget():
+    _, import_seconds, forbidden = bench_startup(1)
+    assert forbidden == []
+    assert import_seconds <= DEFAULT_IMPORT_BUDGET
+
+
+def test_tex_generation_skips_heavy_modules(tmp_path):
+    (tmp_path / "startup.yaml").write_text(STARTUP_CONFIG, encoding="utf-8")
+    code = (
+        "import sys\n"
+        f"sys.path.insert(0, {os.path.dirname(SCRIPT)!r})\n"
+        "import arithmetic_generator\n"
+        "arithmetic_generator.main(['generate', '--config', 'startup.yaml'])\n"
+        f"print(' '.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, capture_output=True, text=True, check=True)
+    assert (tmp_path / "startup.tex").exists()
+    assert result.stdout.splitlines()[-1] == ""
@@ -0,0 +1,495 @@
+"""
+LaTeX compile backends.
+
+Every backend turns LaTeX source into a PDF and returns (success, result),
+where result is the PDF bytes on success or an error message on failure.
+Backends are built from the optional `compile` section of config.yaml:
+
+    compile:
+      backend: "pdflatex"        # texlivenet | pdflatex | lualatex | tectonic
+      fallback: ["texlivenet"]   # tried in order when the backend fails
+      workers: 4                 # local compiles running at the same time
+      max_parallel: 4            # worksheets compiled concurrently
+      batch: 25                  # worksheets joined into one compile (needs pypdf)
+      page_cache: false          # compile and cache pages one by one, then assemble
+      retries: 2                 # extra attempts on transient TeXLive.net failures
+      backoff: 0.5               # base retry delay in seconds, jittered and doubled
+      circuit_breaker:           # fail fast while TeXLive.net is down, or `false`
+        failures: 5
+        reset_after: 30
+      hedge: false               # send a second request after the p95 latency
+      format_cache: true         # dump the preamble to a .fmt once (pdflatex)
+      cache:                     # on-disk PDF cache, or `cache: false`
+        dir: "~/.cache/arithmetic_generator/pdf"
+        max_mb: 500
+"""
+
+import hashlib
+import os
+import secrets
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+
+from profiling import run_in_context, span
+
+
+TEXLIVENET_URL = "https://texlive.net/cgi-bin/latexcgi"
+LOCAL_ENGINES = ("pdflatex", "lualatex", "tectonic")
+BACKENDS = ("texlivenet",) + LOCAL_ENGINES
+DEFAULT_MAX_PARALLEL = 4
+# Responses are streamed to disk in chunks of this size
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DEFAULT_FORMAT_DIR = os.path.join("~", ".cache", "arithmetic_generator", "fmt")
+# Engines whose preamble can be dumped with mylatexformat (tectonic caches formats itself)
+FORMAT_ENGINES = ("pdflatex",)
+
+
+@contextmanager
+def atomic_output(path, mode="wb", encoding=None):
+    """Open a temp file next to path for writing and move it into place on success."""
+    # Exclusive creation under a random name; the OS applies the umask as for open()
+    tmp_path = f"{path}.{secrets.token_hex(8)}.part"
+    f = open(tmp_path, mode.replace("w", "x"), encoding=encoding)
+    try:
+        with f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class TransientError(Exception):
+    """A compile attempt failed for a reason worth retrying (network error, 5xx, timeout)."""
+
+
+class CompileBackend:
+    """Base class for compile backends."""
+
+    name = "base"
+
+    def compile(self, tex_content):
+        """Compile LaTeX content to PDF. Returns (success, pdf_bytes or error message)."""
+        raise NotImplementedError
+
+    def attempt(self, tex_content):
+        """
+        Make a single compile attempt. Like compile, but raises TransientError
+        for failures that another attempt might not hit.
+        """
+        return self.compile(tex_content)
+
+    def compile_to_file(self, tex_content, path):
+        """
+        Compile LaTeX content and write the PDF to path, replacing it atomically.
+        Returns (success, None or error message).
+        """
+        success, result = self.compile(tex_content)
+        if not success:
+            return False, result
+        with atomic_output(path) as f:
+            f.write(result)
+        return True, None
+
+    def attempt_to_file(self, tex_content, path):
+        """Make a single compile_to_file attempt, raising TransientError like attempt."""
+        return self.compile_to_file(tex_content, path)
+
+    def cache_key(self):
+        """Identify the backend and engine version, for compile caches."""
+        return self.name
+
+    def close(self):
+        """Release any resources held by the backend."""
+
+
+class TeXLiveNetBackend(CompileBackend):
+    """Compile through the public TeXLive.net API."""
+
+    name = "TeXLive.net"
+
+    def __init__(self, url=TEXLIVENET_URL, timeout=60, max_connections=DEFAULT_MAX_PARALLEL):
+        self.url = url
+        self.timeout = timeout
+        # Imported here so runs that never talk to TeXLive.net skip the HTTP stack
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        # One keep-alive connection pool shared by every compile
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    def cache_key(self):
+        return f"texlivenet:{self.url}"
+
+    def _post(self, tex_content, stream=False):
+        import requests
+
+        try:
+            return self._session.post(
+                self.url,
+                files={
+                    "filename[]": (None, "document.tex"),
+                    "filecontents[]": (None, tex_content),
+                    "return": (None, "pdf"),
+                },
+                timeout=self.timeout,
+                stream=stream
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise TransientError(str(e)) from e
+
+    @staticmethod
+    def _is_pdf(response):
+        return response.status_code == 200 and response.headers.get('content-type') == 'application/pdf'
+
+    @staticmethod
+    def _error(response):
+        """Return the error message of a non-PDF response, raising TransientError if worth retrying."""
+        message = response.text[:500] if response.text else "Unknown error from API"
+        if response.status_code == 429 or response.status_code >= 500:
+            raise TransientError(f"HTTP {response.status_code}: {message}")
+        return message
+
+    def attempt(self, tex_content):
+        with span("texlivenet"):
+            response = self._post(tex_content)
+        if self._is_pdf(response):
+            return True, response.content
+        return False, self._error(response)
+
+    def attempt_to_file(self, tex_content, path):
+        import requests
+
+        # Stream the body to disk in chunks instead of holding the whole PDF
+        with span("texlivenet"), self._post(tex_content, stream=True) as response:
+            if not self._is_pdf(response):
+                return False, self._error(response)
+            try:
+                with atomic_output(path) as f:
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                raise TransientError(str(e)) from e
+        return True, None
+
+    def compile(self, tex_content):
+        try:
+            return self.attempt(tex_content)
+        except Exception as e:
+            return False, str(e)
+
+    def compile_to_file(self, tex_content, path):
+        try:
+            return self.attempt_to_file(tex_content, path)
+        except Exception as e:
+            return False, str(e)
+
+    def close(self):
+        self._session.close()
+
+
+class LocalLatexBackend(CompileBackend):
+    """
+    Compile with a locally installed engine (pdflatex, lualatex or tectonic).
+
+    Compiles run on a bounded pool of worker threads. Each worker keeps its own
+    temp directory for its whole lifetime, so concurrent runs never share files.
+
+    With format_cache, the document preamble (everything before \\begin{document})
+    is dumped once into a .fmt file with mylatexformat and every later compile
+    with the same preamble loads it instead of loading the packages again. The
+    format is keyed by the preamble and the engine version, so it is rebuilt
+    automatically when either changes.
+    """
+
+    def __init__(self, engine="pdflatex", workers=2, timeout=120, format_cache=True,
+                 format_dir=DEFAULT_FORMAT_DIR):
+        if engine not in LOCAL_ENGINES:
+            raise ValueError(f"Unknown LaTeX engine: {engine}")
+        self.name = engine
+        self.engine = engine
+        self.timeout = timeout
+        self.format_cache = format_cache and engine in FORMAT_ENGINES
+        self.format_dir = os.path.expanduser(format_dir)
+        self._local = threading.local()
+        self._workdirs = []
+        self._lock = threading.Lock()
+        self._format_lock = threading.Lock()
+        self._formats = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{engine}-worker")
+        self._version = None
+
+    def cache_key(self):
+        if self._version is None:
+            try:
+                proc = subprocess.run([self.engine, "--version"], stdout=subprocess.PIPE, timeout=30)
+                lines = proc.stdout.decode("utf-8", errors="replace").splitlines()
+                self._version = lines[0] if lines else ""
+            except (OSError, subprocess.TimeoutExpired):
+                self._version = ""
+        return f"{self.engine}:{self._version}"
+
+    def _workdir(self):
+        """Return the calling worker's private temp directory, creating it on first use."""
+        workdir = getattr(self._local, "workdir", None)
+        if workdir is None:
+            workdir = tempfile.mkdtemp(prefix=f"{self.engine}-")
+            self._local.workdir = workdir
+            with self._lock:
+                self._workdirs.append(workdir)
+        return workdir
+
+    def _command(self, format_name=None):
+        if self.engine == "tectonic":
+            return ["tectonic", "document.tex"]
+        command = [self.engine, "-interaction=nonstopmode", "-halt-on-error"]
+        if format_name:
+            command.append(f"-fmt={format_name}")
+        return command + ["document.tex"]
+
+    def _format_path(self, tex_content):
+        """
+        Return the path of the dumped format for this document's preamble,
+        building it on first use. Returns None if no format can be used.
+        """
+        marker = tex_content.find("\\begin{document}")
+        if not self.format_cache or marker < 0:
+            return None
+        preamble = tex_content[:marker]
+        key = hashlib.sha256(f"{self.cache_key()}\0{preamble}".encode("utf-8")).hexdigest()[:16]
+
+        with self._format_lock:
+            if key in self._formats:
+                return self._formats[key]
+            path = os.path.join(self.format_dir, f"preamble-{key}.fmt")
+            if not os.path.exists(path):
+                with span("format_dump"):
+                    path = self._build_format(preamble, key, path)
+            self._formats[key] = path
+            return path
+
+    def _build_format(self, preamble, key, path):
+        """Dump the preamble into a format file; returns its path or None on failure."""
+        jobname = f"preamble-{key}"
+        builddir = tempfile.mkdtemp(prefix=f"{self.engine}-fmt-")
+        try:
+            with open(os.path.join(builddir, "preamble.tex"), "w", encoding="utf-8") as f:
+                f.write(preamble + "\\begin{document}\n\\end{document}\n")
+            proc = subprocess.run(
+                [self.engine, "-ini", "-interaction=nonstopmode", f"-jobname={jobname}",
+                 f"&{self.engine}", "mylatexformat.ltx", "preamble.tex"],
+                cwd=builddir,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=self.timeout
+            )
+            built = os.path.join(builddir, jobname + ".fmt")
+            if proc.returncode != 0 or not os.path.exists(built):
+                return None
+            os.makedirs(self.format_dir, exist_ok=True)
+            # Move into place atomically so other processes never see a partial file
+            tmp_path = path + f".{os.getpid()}.tmp"
+            shutil.copyfile(built, tmp_path)
+            os.replace(tmp_path, path)
+            return path
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        finally:
+            shutil.rmtree(builddir, ignore_errors=True)
+
+    def _run(self, tex_content, output_path=None):
+        """Compile in the worker's directory; with output_path, copy the PDF there instead of returning it."""
+        workdir = self._workdir()
+        tex_path = os.path.join(workdir, "document.tex")
+        pdf_path = os.path.join(workdir, "document.pdf")
+        if os.path.exists(pdf_path):
+            os.remove(pdf_path)
+        with open(tex_path, "w", encoding="utf-8") as f:
+            f.write(tex_content)
+
+        # Keep a copy of the format in the worker's directory, where the engine finds it
+        format_name = None
+        format_path = self._format_path(tex_content)
+        if format_path:
+            format_name = os.path.splitext(os.path.basename(format_path))[0]
+            local_format = os.path.join(workdir, format_name + ".fmt")
+            if not os.path.exists(local_format):
+                shutil.copyfile(format_path, local_format)
+
+        try:
+            proc = subprocess.run(
+                self._command(format_name),
+                cwd=workdir,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                timeout=self.timeout
+            )
+        except FileNotFoundError:
+            return False, f"{self.engine} is not installed"
+        except subprocess.TimeoutExpired:
+            return False, f"{self.engine} timed out after {self.timeout}s"
+
+        if proc.returncode == 0 and os.path.exists(pdf_path):
+            if output_path is not None:
+                with atomic_output(output_path) as out, open(pdf_path, "rb") as f:
+                    shutil.copyfileobj(f, out)
+                return True, None
+            with open(pdf_path, "rb") as f:
+                return True, f.read()
+        output = proc.stdout.decode("utf-8", errors="replace")
+        return False, output[-500:] if output else f"{self.engine} failed"
+
+    def compile(self, tex_content):
+        return self.compile_to_file(tex_content, None)
+
+    def compile_to_file(self, tex_content, path):
+        if shutil.which(self.engine) is None:
+            return False, f"{self.engine} is not installed"
+        try:
+            with span(self.engine):
+                return self._executor.submit(self._run, tex_content, path).result()
+        except Exception as e:
+            return False, str(e)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for workdir in self._workdirs:
+                shutil.rmtree(workdir, ignore_errors=True)
+            self._workdirs.clear()
+
+
+class FallbackBackend(CompileBackend):
+    """Try each backend in order until one succeeds."""
+
+    def __init__(self, backends):
+        self.backends = backends
+        self.name = " → ".join(b.name for b in backends)
+
+    def cache_key(self):
+        return "|".join(b.cache_key() for b in self.backends)
+
+    def compile(self, tex_content):
+        return self._first_success(lambda backend: backend.compile(tex_content))
+
+    def compile_to_file(self, tex_content, path):
+        return self._first_success(lambda backend: backend.compile_to_file(tex_content, path))
+
+    def _first_success(self, compile_with):
+        errors = []
+        for backend in self.backends:
+            success, result = compile_with(backend)
+            if success:
+                return True, result
+            errors.append(f"{backend.name}: {result}")
+        return False, "\n".join(errors)
+
+    def close(self):
+        for backend in self.backends:
+            backend.close()
+
+
+def _create_single_backend(name, compile_config):
+    if name == "texlivenet":
+        max_parallel = compile_config.get("max_parallel", DEFAULT_MAX_PARALLEL)
+        backend = TeXLiveNetBackend(
+            url=compile_config.get("url", TEXLIVENET_URL),
+            timeout=compile_config.get("timeout", 60),
+            # Room for a hedged second request next to every first one
+            max_connections=2 * max_parallel
+        )
+        from resilient_backend import create_resilient_backend
+
+        return create_resilient_backend(backend, compile_config)
+    if name in LOCAL_ENGINES:
+        return LocalLatexBackend(
+            engine=name,
+            workers=compile_config.get("workers", 2),
+            timeout=compile_config.get("timeout", 120),
+            format_cache=compile_config.get("format_cache", True),
+            format_dir=compile_config.get("format_dir", DEFAULT_FORMAT_DIR)
+        )
+    raise ValueError(f"Unknown compile backend: {name}")
+
+
+def create_backend(compile_config=None):
+    """Build a compile backend from the `compile` section of config.yaml."""
+    compile_config = compile_config or {}
+    fallback = compile_config.get("fallback", [])
+    if isinstance(fallback, str):
+        fallback = [fallback]
+
+    names = [compile_config.get("backend", "texlivenet")] + list(fallback)
+    backends = [_create_single_backend(name, compile_config) for name in names]
+    backend = backends[0] if len(backends) == 1 else FallbackBackend(backends)
+
+    cache_config = compile_config.get("cache", {})
+    if cache_config is False:
+        return backend
+    if cache_config is True:
+        cache_config = {}
+
+    from pdf_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_MB, CachedBackend, PDFCache
+    cache = PDFCache(
+        directory=cache_config.get("dir", DEFAULT_CACHE_DIR),
+        max_bytes=int(cache_config.get("max_mb", DEFAULT_MAX_MB) * 1024 * 1024)
+    )
+    return CachedBackend(backend, cache)
+
+
+def _timed_compile(backend, tex_content):
+    with span("compile"):
+        return backend.compile(tex_content)
+
+
+def _timed_compile_to_file(backend, tex_content, path):
+    with span("compile"):
+        return backend.compile_to_file(tex_content, path)
+
+
+def iter_compile_to_files(backend, jobs, max_workers=DEFAULT_MAX_PARALLEL):
+    """
+    Compile [(tex_content, output_path)] concurrently, writing each PDF
+    straight to its path. Yields (index, (success, None or error message)).
+    """
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="compile") as executor:
+        futures = {
+            executor.submit(run_in_context(_timed_compile_to_file), backend, tex, path): index
+            for index, (tex, path) in enumerate(jobs)
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = (False, str(e))
+            yield futures[future], result
+
+
+def iter_compile(backend, tex_contents, max_workers=DEFAULT_MAX_PARALLEL):
+    """
+    Compile several documents concurrently.
+
+    Yields (index, (success, result)) as each compile finishes, so callers can
+    report progress right away and put results back in input order by index.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="compile") as executor:
+        futures = {
+            executor.submit(run_in_context(_timed_compile), backend, tex): index
+            for index, tex in enumerate(tex_contents)
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = (False, str(e))
+            yield futures[future], result
@@ -4,13 +4,21 @@ A child-friendly web interface for generating math worksheets using TeXLive.net
 """
 
 import streamlit as st
-import requests
-import zipfile
-import tempfile
 import os
+import random
 import re
-from io import BytesIO
-from arithmetic_generator import generate_latex
+import uuid
+from contextlib import nullcontext
+from importlib.util import find_spec
+from arithmetic_generator import (
+    answer_key_mode, config_hash, write_latex
+)
+from artifact_store import ArtifactStore, create_zip_from_files
+from carry_control import CARRY_OPTIONS
+from job_queue import JobQueue, QueueFull
+from native_pdf import write_pdf
+from profiling import StageTimer, span
+from tex_compiler import DEFAULT_MAX_PARALLEL, LOCAL_ENGINES, atomic_output, create_backend
 
 
 # ============================================================================
@@ -31,6 +39,14 @@ TRANSLATIONS = {
         "pdf_options": "⚙️ PDF Options",
         "generate_pdf_checkbox": "📄 Generate PDF files",
         "generate_pdf_help": "Convert .tex files to PDF using TeXLive.net API",
+        "compile_backend_label": "🖨️ PDF Compiler",
+        "compile_backend_help": "TeXLive.net needs no installation. Local engines use LaTeX installed on this server.",
+        "backend_texlivenet": "TeXLive.net (online)",
+        "backend_local": "Local {engine}",
+        "backend_native": "Built-in (no LaTeX, instant)",
+        "fallback_checkbox": "↩️ Fall back to TeXLive.net",
+        "fallback_help": "Use TeXLive.net when the local compile fails",
+        "cache_stats": "🗄️ PDF cache: {hits} hits / {misses} misses",
         
         # Worksheet configuration
         "configure_worksheets": "📚 Configure Your Worksheets",
@@ -42,6 +58,14 @@ TRANSLATIONS = {
         "num_pages_help": "How many pages of practice?",
         "start_page_label": "🔢 Starting Page Number",
         "start_page_help": "What number should the first page show?",
+        "seed_label": "🎲 Problem Set Number",
+        "seed_help": "The same number always gives the same problems. Change it to get a new set!",
+        "new_problems": "🔀 New Problems",
+        "answer_key_label": "🔑 Answer Key",
+        "answer_key_help": "Add the answers as extra pages at the end, or as a separate file. The key is made from the same problems and compiled together with the worksheet.",
+        "answer_key_none": "No answer key",
+        "answer_key_pages": "Extra pages at the end",
+        "answer_key_separate": "Separate file",
         
         # Problem types
         "problem_types_header": "🎲 Problem Types",
@@ -61,6 +85,22 @@ TRANSLATIONS = {
         "questions_per_page_help": "How many of this type per page?",
         "easy_mode": "🌟 Easy Mode",
         "easy_mode_help": "No negative answers (subtraction) or no remainders (division)",
+        "unique_label": "🔁 Repeated Problems",
+        "unique_help": "Avoid the same problem appearing twice. Problems only repeat once every possible one has been used.",
+        "unique_off": "Allowed",
+        "unique_page": "No repeats on a page",
+        "unique_workbook": "No repeats in the whole worksheet",
+        "carry_label": "🔟 Carrying",
+        "carry_help": "Control how many columns carry over to the next place value.",
+        "borrow_label": "🔟 Borrowing",
+        "borrow_help": "Control how many columns need to borrow from the next place value.",
+        "carry_any": "Any",
+        "carry_none": "No carrying",
+        "carry_required": "At least one carry",
+        "carry_one": "At most one carry",
+        "borrow_none": "No borrowing",
+        "borrow_required": "At least one borrow",
+        "borrow_one": "At most one borrow",
         "delete_worksheet": "🗑️ Delete This Worksheet",
         
         # Generate section
@@ -70,12 +110,21 @@ TRANSLATIONS = {
         "max_questions_error": "Maximum 50 questions per page allowed in '{name}'! (Current total: {total})",
         
         # Progress messages
-        "generating": "📝 Generating",
-        "converting_to_pdf": "📄 Converting {name} to PDF (via TeXLive.net)...",
+        "job_queued": "⏳ {name} is waiting in the queue...",
+        "job_running": "📝 Generating {name}...",
+        "job_expired": "❌ A worksheet expired before it was collected. Please generate again.",
+        "queue_full": "⏳ The server is busy right now. Please try again in a moment.",
+        "files_expired": "⌛ These files have expired. Please generate the worksheets again.",
         "pdf_generated": "✅ {name} PDF generated!",
         "pdf_failed": "❌ PDF generation failed for {name}: {error}",
         "error_generating": "❌ Error generating {name}: {error}",
         "all_done": "✨ All done!",
+        "diagnostics_header": "⏱️ Diagnostics",
+        "diagnostics_generation": "Last generation: {seconds:.2f}s total",
+        "diagnostics_rerun": "Previous page refresh: {ms:.0f}ms",
+        "diagnostics_stage": "Stage",
+        "diagnostics_total": "Total (ms)",
+        "diagnostics_calls": "Calls",
         
         # Download section
         "download_header": "📥 Download Your Files",
@@ -100,6 +149,14 @@ TRANSLATIONS = {
         "pdf_options": "⚙️ PDF 옵션",
         "generate_pdf_checkbox": "📄 PDF 파일 생성",
         "generate_pdf_help": "TeXLive.net API를 사용하여 .tex 파일을 PDF로 변환합니다.",
+        "compile_backend_label": "🖨️ PDF 컴파일러",
+        "compile_backend_help": "TeXLive.net은 설치가 필요 없습니다. 로컬 엔진은 이 서버에 설치된 LaTeX를 사용합니다.",
+        "backend_texlivenet": "TeXLive.net (온라인)",
+        "backend_local": "로컬 {engine}",
+        "backend_native": "내장 렌더러 (LaTeX 없이 즉시 생성)",
+        "fallback_checkbox": "↩️ 실패 시 TeXLive.net 사용",
+        "fallback_help": "로컬 컴파일이 실패하면 TeXLive.net으로 다시 시도합니다",
+        "cache_stats": "🗄️ PDF 캐시: 적중 {hits}회 / 미적중 {misses}회",
         
         # Worksheet configuration
         "configure_worksheets": "📚 문제지 설정",
@@ -111,6 +168,14 @@ TRANSLATIONS = {
         "num_pages_help": "몇 페이지의 연습문제를 만들까요?",
         "start_page_label": "🔢 시작 페이지 번호",
         "start_page_help": "첫 페이지에 표시될 번호는?",
+        "seed_label": "🎲 문제 세트 번호",
+        "seed_help": "번호가 같으면 항상 같은 문제가 나와요. 새 문제를 원하면 번호를 바꾸세요!",
+        "new_problems": "🔀 새 문제",
+        "answer_key_label": "🔑 정답지",
+        "answer_key_help": "정답을 문제지 뒤에 페이지로 붙이거나 별도 파일로 만듭니다. 같은 문제로 만들어 문제지와 함께 컴파일합니다.",
+        "answer_key_none": "정답지 없음",
+        "answer_key_pages": "문제지 뒤에 붙이기",
+        "answer_key_separate": "별도 파일",
         
         # Problem types
         "problem_types_header": "🎲 문제 유형",
@@ -130,6 +195,22 @@ TRANSLATIONS = {
         "questions_per_page_help": "이 유형의 문제를 페이지당 몇 개?",
         "easy_mode": "🌟 쉬운 모드",
         "easy_mode_help": "음수 없음(뺄셈) 또는 나머지 없음(나눗셈)",
+        "unique_label": "🔁 중복 문제",
+        "unique_help": "같은 문제가 두 번 나오지 않게 합니다. 가능한 문제를 모두 쓴 뒤에만 다시 나옵니다.",
+        "unique_off": "허용",
+        "unique_page": "한 페이지 안에서 중복 없음",
+        "unique_workbook": "문제지 전체에서 중복 없음",
+        "carry_label": "🔟 받아올림",
+        "carry_help": "받아올림이 생기는 자리 수를 정합니다.",
+        "borrow_label": "🔟 받아내림",
+        "borrow_help": "받아내림이 필요한 자리 수를 정합니다.",
+        "carry_any": "상관없음",
+        "carry_none": "받아올림 없음",
+        "carry_required": "받아올림 한 번 이상",
+        "carry_one": "받아올림 최대 한 번",
+        "borrow_none": "받아내림 없음",
+        "borrow_required": "받아내림 한 번 이상",
+        "borrow_one": "받아내림 최대 한 번",
         "delete_worksheet": "🗑️ 이 문제지 삭제",
         
         # Generate section
@@ -139,12 +220,21 @@ TRANSLATIONS = {
         "max_questions_error": "'{name}' 문제지의 페이지당 문제가 너무 많습니다! 최대 50개까지 가능합니다. (현재 합계: {total})",
         
         # Progress messages
-        "generating": "📝 생성 중",
-        "converting_to_pdf": "📄 {name}을(를) PDF로 변환 중 (TeXLive.net 서비스 이용)...",
+        "job_queued": "⏳ {name} 대기 중...",
+        "job_running": "📝 {name} 생성 중...",
+        "job_expired": "❌ 문제지 결과가 만료되었습니다. 다시 생성해 주세요.",
+        "queue_full": "⏳ 지금은 요청이 많습니다. 잠시 후 다시 시도해 주세요.",
+        "files_expired": "⌛ 파일 보관 기간이 지났습니다. 학습지를 다시 생성해 주세요.",
         "pdf_generated": "✅ {name} PDF 생성 완료!",
         "pdf_failed": "❌ {name} PDF 생성 실패: {error}",
         "error_generating": "❌ {name} 생성 오류: {error}",
         "all_done": "✨ 모두 완료!",
+        "diagnostics_header": "⏱️ 진단 정보",
+        "diagnostics_generation": "마지막 생성: 총 {seconds:.2f}초",
+        "diagnostics_rerun": "이전 화면 갱신: {ms:.0f}ms",
+        "diagnostics_stage": "단계",
+        "diagnostics_total": "합계 (ms)",
+        "diagnostics_calls": "호출 수",
         
         # Download section
         "download_header": "📥 파일 다운로드",
@@ -169,6 +259,14 @@ TRANSLATIONS = {
         "pdf_options": "⚙️ PDF-Optionen",
         "generate_pdf_checkbox": "📄 PDF-Dateien generieren",
         "generate_pdf_help": "Konvertieren Sie .tex-Dateien in PDF mit der TeXLive.net-API",
+        "compile_backend_label": "🖨️ PDF-Compiler",
+        "compile_backend_help": "TeXLive.net benötigt keine Installation. Lokale Engines nutzen das auf diesem Server installierte LaTeX.",
+        "backend_texlivenet": "TeXLive.net (online)",
+        "backend_local": "Lokales {engine}",
+        "backend_native": "Integriert (ohne LaTeX, sofort)",
+        "fallback_checkbox": "↩️ Auf TeXLive.net ausweichen",
+        "fallback_help": "TeXLive.net verwenden, wenn die lokale Kompilierung fehlschlägt",
+        "cache_stats": "🗄️ PDF-Cache: {hits} Treffer / {misses} Fehlschläge",
         
         # Worksheet configuration
         "configure_worksheets": "📚 Konfigurieren Sie Ihre Arbeitsblätter",
@@ -180,6 +278,14 @@ TRANSLATIONS = {
         "num_pages_help": "Wie viele Seiten Übung?",
         "start_page_label": "🔢 Startseitennummer",
         "start_page_help": "Welche Nummer soll die erste Seite zeigen?",
+        "seed_label": "🎲 Aufgabensatz-Nummer",
+        "seed_help": "Dieselbe Nummer ergibt immer dieselben Aufgaben. Ändere sie für einen neuen Satz!",
+        "new_problems": "🔀 Neue Aufgaben",
+        "answer_key_label": "🔑 Lösungsblatt",
+        "answer_key_help": "Fügt die Lösungen als zusätzliche Seiten am Ende oder als eigene Datei hinzu. Das Lösungsblatt entsteht aus denselben Aufgaben und wird zusammen mit dem Arbeitsblatt kompiliert.",
+        "answer_key_none": "Kein Lösungsblatt",
+        "answer_key_pages": "Zusätzliche Seiten am Ende",
+        "answer_key_separate": "Eigene Datei",
         
         # Problem types
         "problem_types_header": "🎲 Aufgabentypen",
@@ -199,6 +305,22 @@ TRANSLATIONS = {
         "questions_per_page_help": "Wie viele von diesem Typ pro Seite?",
         "easy_mode": "🌟 Einfacher Modus",
         "easy_mode_help": "Keine negativen Ergebnisse (Subtraktion) oder keine Reste (Division)",
+        "unique_label": "🔁 Wiederholte Aufgaben",
+        "unique_help": "Verhindert, dass dieselbe Aufgabe zweimal vorkommt. Aufgaben wiederholen sich erst, wenn alle möglichen verwendet wurden.",
+        "unique_off": "Erlaubt",
+        "unique_page": "Keine Wiederholung auf einer Seite",
+        "unique_workbook": "Keine Wiederholung im ganzen Arbeitsblatt",
+        "carry_label": "🔟 Übertrag",
+        "carry_help": "Legt fest, wie viele Stellen einen Übertrag auf die nächste Stelle haben.",
+        "borrow_label": "🔟 Entbündeln",
+        "borrow_help": "Legt fest, wie viele Stellen von der nächsten Stelle borgen müssen.",
+        "carry_any": "Beliebig",
+        "carry_none": "Ohne Übertrag",
+        "carry_required": "Mindestens ein Übertrag",
+        "carry_one": "Höchstens ein Übertrag",
+        "borrow_none": "Ohne Entbündeln",
+        "borrow_required": "Mindestens einmal entbündeln",
+        "borrow_one": "Höchstens einmal entbündeln",
         "delete_worksheet": "🗑️ Dieses Arbeitsblatt löschen",
         
         # Generate section
@@ -208,12 +330,21 @@ TRANSLATIONS = {
         "max_questions_error": "Maximal 50 Aufgaben pro Seite in '{name}' erlaubt! (Aktuelle Gesamtzahl: {total})",
         
         # Progress messages
-        "generating": "📝 Generiere",
-        "converting_to_pdf": "📄 Konvertiere {name} in PDF (über TeXLive.net)...",
+        "job_queued": "⏳ {name} wartet in der Warteschlange...",
+        "job_running": "📝 Generiere {name}...",
+        "job_expired": "❌ Ein Arbeitsblatt ist abgelaufen, bevor es abgeholt wurde. Bitte erneut generieren.",
+        "queue_full": "⏳ Der Server ist gerade ausgelastet. Bitte versuchen Sie es gleich noch einmal.",
+        "files_expired": "⌛ Diese Dateien sind abgelaufen. Bitte erstellen Sie die Arbeitsblätter erneut.",
         "pdf_generated": "✅ {name} PDF generiert!",
         "pdf_failed": "❌ PDF-Generierung fehlgeschlagen für {name}: {error}",
         "error_generating": "❌ Fehler beim Generieren von {name}: {error}",
         "all_done": "✨ Alles fertig!",
+        "diagnostics_header": "⏱️ Diagnose",
+        "diagnostics_generation": "Letzte Erstellung: {seconds:.2f}s insgesamt",
+        "diagnostics_rerun": "Vorherige Seitenaktualisierung: {ms:.0f}ms",
+        "diagnostics_stage": "Phase",
+        "diagnostics_total": "Gesamt (ms)",
+        "diagnostics_calls": "Aufrufe",
         
         # Download section
         "download_header": "📥 Laden Sie Ihre Dateien herunter",
@@ -350,38 +481,48 @@ st.markdown("""
 # UTILITY FUNCTIONS
 # ============================================================================
 
-def compile_tex_with_texlivenet(tex_content):
-    """Compile LaTeX content to PDF using TeXLive.net API."""
-    try:
-        response = requests.post(
-            "https://texlive.net/cgi-bin/latexcgi",
-            files={
-                "filename[]": (None, "document.tex"),
-                "filecontents[]": (None, tex_content),
-                "return": (None, "pdf"),
-            },
-            timeout=60
-        )
-        
-        if response.status_code == 200 and response.headers.get('content-type') == 'application/pdf':
-            return True, response.content
-        else:
-            return False, response.text[:500] if response.text else "Unknown error from API"
-    except Exception as e:
-        return False, str(e)
-
-
-def create_zip_from_files(file_dict):
-    """Create a zip file from a dictionary of {filename: content}."""
-    zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for filename, content in file_dict.items():
-            if isinstance(content, bytes):
-                zip_file.writestr(filename, content)
-            else:
-                zip_file.writestr(filename, content.encode('utf-8'))
-    zip_buffer.seek(0)
-    return zip_buffer
+@st.cache_resource
+def get_compile_backend(backend_name, fallback):
+    """Create a compile backend once per process so local worker pools stay warm."""
+    compile_config = {'backend': backend_name}
+    if fallback and backend_name != 'texlivenet':
+        compile_config['fallback'] = ['texlivenet']
+    return create_backend(compile_config)
+
+
+# Generated files are kept on disk for reuse across reruns and sessions
+ARTIFACT_TTL = 60 * 60  # seconds
+
+
+# Background jobs shared by every session; the depth caps queued plus running jobs
+JOB_WORKERS = DEFAULT_MAX_PARALLEL
+JOB_QUEUE_DEPTH = 32
+JOB_POLL_INTERVAL = 1.0  # seconds
+
+
+@st.cache_resource
+def get_job_queue():
+    """Process-wide worker pool that generates worksheets in the background."""
+    return JobQueue(workers=JOB_WORKERS, max_depth=JOB_QUEUE_DEPTH, ttl=ARTIFACT_TTL)
+
+
+@st.cache_resource
+def get_artifact_store():
+    """Process-wide disk store of generated LaTeX, PDFs and archives, keyed by config hash."""
+    return ArtifactStore(ttl=ARTIFACT_TTL)
+
+
+def get_session_id():
+    """Id of the artifact store directory holding this browser session's current downloads."""
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    return st.session_state.session_id
+
+
+def read_file(path):
+    """Read a stored file when its download button is clicked."""
+    with open(path, 'rb') as f:
+        return f.read()
 
 
 # ============================================================================
@@ -389,6 +530,13 @@ def create_zip_from_files(file_dict):
 # ============================================================================
 
 def main():
+    # Time every rerun; the diagnostics panel shows the previous one
+    with StageTimer() as timer:
+        render_app()
+    st.session_state.last_rerun = (timer.elapsed, timer.report())
+
+
+def render_app():
     # Initialize language in session state
     if 'language' not in st.session_state:
         st.session_state.language = 'ko'
@@ -413,6 +561,36 @@ def main():
         if language_options[selected_lang] != st.session_state.language:
             st.session_state.language = language_options[selected_lang]
             st.rerun()
+
+        # PDF compile backend
+        st.markdown(f"## {t('pdf_options')}")
+        backend_options = {"texlivenet": t("backend_texlivenet")}
+        for engine in LOCAL_ENGINES:
+            backend_options[engine] = t("backend_local", engine=engine)
+        backend_options["native"] = t("backend_native")
+        st.session_state.compile_backend = st.selectbox(
+            t("compile_backend_label"),
+            options=list(backend_options.keys()),
+            format_func=backend_options.get,
+            index=list(backend_options.keys()).index(st.session_state.get('compile_backend', 'texlivenet')),
+            help=t("compile_backend_help")
+        )
+        if st.session_state.compile_backend in LOCAL_ENGINES:
+            st.session_state.compile_fallback = st.checkbox(
+                t("fallback_checkbox"),
+                value=st.session_state.get('compile_fallback', True),
+                help=t("fallback_help")
+            )
+
+        if st.session_state.compile_backend != 'native':
+            backend = get_compile_backend(
+                st.session_state.compile_backend,
+                st.session_state.get('compile_fallback', True)
+            )
+            cache = getattr(backend, 'cache', None)
+            if cache is not None:
+                stats = cache.stats()
+                st.caption(t("cache_stats", hits=stats['hits'], misses=stats['misses']))
     
     # Header with fun emojis
     st.markdown(f'<h1 class="main-header">{t("main_header")}</h1>', unsafe_allow_html=True)
@@ -456,10 +634,18 @@ def main():
     if generate_button:
         generate_worksheets()
     
-    # Render downloads if they exist
-    if st.session_state.generated_files:
+    # Poll queued worksheets until they finish, then offer the downloads
+    if st.session_state.get('jobs'):
+        render_jobs()
+    elif st.session_state.generated_files:
+        if st.session_state.pop('jobs_finished', False):
+            st.success(t("all_done"))
+            st.balloons()
         render_downloads()
     
+    if st.session_state.get('last_generation'):
+        render_diagnostics()
+    
     # Footer
     st.markdown(f"""
         <div class="footer">
@@ -474,6 +660,7 @@ def create_default_worksheet(name):
         'name': name,
         'n_page': 5,
         'page_offset': 1,
+        'seed': random.randrange(1000000),
         'problems': [
             {
                 'type': 'addition',
@@ -529,6 +716,38 @@ def render_worksheet_config(idx, worksheet):
             help=t("start_page_help")
         )
     
+    # Problem set number: the same number always gives the same problems
+    worksheet.setdefault('seed', random.randrange(1000000))
+    col1, col2 = st.columns([2, 1])
+    
+    with col1:
+        worksheet['seed'] = st.number_input(
+            t("seed_label"),
+            min_value=0,
+            max_value=999999,
+            value=worksheet['seed'],
+            key=f"seed_{idx}",
+            help=t("seed_help")
+        )
+    
+    with col2:
+        st.markdown("<br>", unsafe_allow_html=True)
+        if st.button(t("new_problems"), key=f"reseed_{idx}"):
+            worksheet['seed'] = random.randrange(1000000)
+            st.rerun()
+    
+    # Answer key: none, extra pages at the end, or a separate file
+    answer_key_choices = {"": t("answer_key_none"), "pages": t("answer_key_pages"),
+                          "separate": t("answer_key_separate")}
+    worksheet['answer_key'] = st.selectbox(
+        t("answer_key_label"),
+        options=list(answer_key_choices.keys()),
+        format_func=answer_key_choices.get,
+        index=list(answer_key_choices.keys()).index(worksheet.get('answer_key') or ""),
+        key=f"answer_key_{idx}",
+        help=t("answer_key_help")
+    ) or None
+    
     # Problem types
     st.markdown(f"### {t('problem_types_header')}")
     st.markdown(t("problem_types_desc"))
@@ -608,6 +827,33 @@ def render_worksheet_config(idx, worksheet):
                 )
             else:
                 problem['easymode'] = False
+            
+            unique_options = {"": t("unique_off"), "page": t("unique_page"), "workbook": t("unique_workbook")}
+            problem['unique'] = st.selectbox(
+                t("unique_label"),
+                options=list(unique_options.keys()),
+                format_func=unique_options.get,
+                index=list(unique_options.keys()).index(problem.get('unique') or ""),
+                key=f"unique_{idx}_{p_idx}",
+                help=t("unique_help")
+            ) or None
+
+            # Carry control for addition, borrow control for subtraction
+            option = CARRY_OPTIONS.get(problem['type'])
+            for other in ('carry', 'borrow'):
+                if other != option:
+                    problem.pop(other, None)
+            if option:
+                carry_choices = {"": t("carry_any"), "none": t(f"{option}_none"),
+                                 "required": t(f"{option}_required"), 1: t(f"{option}_one")}
+                problem[option] = st.selectbox(
+                    t(f"{option}_label"),
+                    options=list(carry_choices.keys()),
+                    format_func=carry_choices.get,
+                    index=list(carry_choices.keys()).index(problem.get(option) or ""),
+                    key=f"{option}_{idx}_{p_idx}",
+                    help=t(f"{option}_help")
+                ) or None
         
         with col4:
             st.markdown("<br>", unsafe_allow_html=True)
@@ -629,75 +875,196 @@ def render_worksheet_config(idx, worksheet):
             st.rerun()
 
 
+def build_worksheet(config, base_filename, backend, store, session_id):
+    """
+    Background job: generate one worksheet and compile its PDF straight to the
+    artifact store, reusing stored artifacts. A separate answer key is made
+    from the same problems and compiled in the same round-trip. Returns
+    ({filename: path}, compile error or None, elapsed, stage report).
+    """
+    shared = {}
+    error = None
+    key = config_hash(config)
+    separate = answer_key_mode(config) == "separate"
+    key_filename = base_filename + '_answers'
+    with StageTimer() as timer:
+        if backend is None:
+            # Built-in renderer writes the PDF directly, no compile step
+            pdf_path = store.lookup(key, '.native.pdf')
+            key_path = store.lookup(key, '.native.answers.pdf') if separate else None
+            if pdf_path is None or (separate and key_path is None):
+                pdf_path = store.shared_path(key, '.native.pdf')
+                key_path = store.shared_path(key, '.native.answers.pdf') if separate else None
+                with atomic_output(pdf_path) as f, \
+                        (atomic_output(key_path) if separate else nullcontext()) as key_f:
+                    write_pdf(config, f, key_fp=key_f)
+            shared[base_filename + '.pdf'] = pdf_path
+            if separate:
+                shared[key_filename + '.pdf'] = key_path
+        else:
+            sources = {base_filename: store.lookup(key, '.tex')}
+            if separate:
+                sources[key_filename] = store.lookup(key, '.answers.tex')
+            if None in sources.values():
+                # Pages are streamed, each written with its answer key page
+                sources[base_filename] = store.shared_path(key, '.tex')
+                if separate:
+                    sources[key_filename] = store.shared_path(key, '.answers.tex')
+                with atomic_output(sources[base_filename], 'w', encoding='utf-8') as f, \
+                        (atomic_output(sources[key_filename], 'w', encoding='utf-8')
+                         if separate else nullcontext()) as key_f:
+                    write_latex(config, f, key_fp=key_f)
+            for name, tex_path in sources.items():
+                shared[name + '.tex'] = tex_path
+
+            pdf_key = config_hash({'config': key, 'backend': backend.cache_key()})
+            suffixes = {base_filename: '.pdf', key_filename: '.answers.pdf'}
+            pdfs = {name: store.lookup(pdf_key, suffixes[name]) for name in sources}
+            missing = [name for name, path in pdfs.items() if path is None]
+            if missing:
+                latex = {}
+                for name in missing:
+                    with open(sources[name], 'r', encoding='utf-8') as f:
+                        latex[name] = f.read()
+                with span("compile"):
+                    results = compile_documents(backend, [latex[name] for name in missing],
+                                                [store.shared_path(pdf_key, suffixes[name]) for name in missing])
+                for name, (success, result) in zip(missing, results):
+                    if success:
+                        pdfs[name] = store.shared_path(pdf_key, suffixes[name])
+                    else:
+                        error = error or result
+            for name, pdf_path in pdfs.items():
+                if pdf_path is not None:
+                    shared[name + '.pdf'] = pdf_path
+        files = {filename: store.link(path, session_id, filename) for filename, path in shared.items()}
+    return files, error, timer.elapsed, timer.report()
+
+
+def compile_documents(backend, tex_contents, paths):
+    """
+    Compile documents to the given paths, several in one round-trip when
+    pypdf can split the result. Returns [(success, None or error message)].
+    """
+    if len(tex_contents) > 1 and find_spec('pypdf') is not None:
+        from pdf_batch import compile_batch
+
+        results = []
+        for path, (success, result) in zip(paths, compile_batch(backend, tex_contents)):
+            if success:
+                with atomic_output(path) as f:
+                    f.write(result)
+                result = None
+            results.append((success, result))
+        return results
+    return [backend.compile_to_file(tex, path) for tex, path in zip(tex_contents, paths)]
+
+
 def generate_worksheets():
-    """Generate all configured worksheets."""
-    generate_pdf = True # Always generate PDF in web interface
+    """
+    Queue every configured worksheet as a background job.
+
+    Jobs run on the process-wide worker pool, so they keep going through reruns;
+    the session only keeps their ids and render_jobs polls them.
+    """
     if not st.session_state.worksheets:
         st.error(t("no_worksheets_error"))
         return
     
-    generated_files = {}
-    
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    total_steps = len(st.session_state.worksheets) * (2 if generate_pdf else 1)
-    current_step = 0
+    store = get_artifact_store()
+    store.sweep()
+    # The new files go to a directory of their own, so the current downloads
+    # keep working unless the new jobs are accepted
+    session_id = uuid.uuid4().hex
+    backend_name = st.session_state.get('compile_backend', 'texlivenet')
+    backend = None
+    if backend_name != 'native':
+        backend = get_compile_backend(backend_name, st.session_state.get('compile_fallback', True))
     
+    tasks = []
     for worksheet in st.session_state.worksheets:
         # Validation: Check if total questions per page exceeds 50
         total_q_per_page = sum(p.get('questions_per_page', 0) for p in worksheet['problems'])
         if total_q_per_page > 50:
             st.error(t("max_questions_error", name=worksheet['name'], total=total_q_per_page))
             return
-
-        status_text.text(f"{t('generating')} {worksheet['name']}...")
         
-        # Build config for generator
+        # Build config for generator; artifacts are keyed by its hash (which
+        # includes the seed), so only changed worksheets are built again
         config = {
             'n_page': worksheet['n_page'],
             'page_offset': worksheet['page_offset'],
-            'problems': worksheet['problems']
+            'seed': worksheet.get('seed', 0),
+            'problems': [dict(p) for p in worksheet['problems']]
         }
-        
-        try:
-            # Generate LaTeX
-            latex_content = generate_latex(config)
-            base_filename = name_to_filename(worksheet['name'])
-            tex_filename = base_filename + '.tex'
-            
-            generated_files[tex_filename] = latex_content
-            current_step += 1
-            progress_bar.progress(current_step / total_steps)
-            
-            # Generate PDF if requested
-            if generate_pdf:
-                status_text.text(t("converting_to_pdf", name=worksheet['name']))
-                
-                success, result = compile_tex_with_texlivenet(latex_content)
-                
-                if success:
-                    pdf_filename = base_filename + '.pdf'
-                    generated_files[pdf_filename] = result
-                    st.success(t("pdf_generated", name=worksheet['name']))
-                else:
-                    st.error(t("pdf_failed", name=worksheet['name'], error=result))
-                
-                current_step += 1
-                progress_bar.progress(current_step / total_steps)
-            
-        except Exception as e:
-            st.error(t("error_generating", name=worksheet['name'], error=str(e)))
-            # Increment step anyway to keep progress bar moving
-            current_step += (2 if generate_pdf else 1)
-            progress_bar.progress(current_step / total_steps)
+        if worksheet.get('answer_key'):
+            config['answer_key'] = worksheet['answer_key']
+        base_filename = name_to_filename(worksheet['name'])
+        tasks.append((worksheet['name'], build_worksheet, (config, base_filename, backend, store, session_id)))
     
-    progress_bar.progress(1.0)
-    status_text.text(t("all_done"))
+    try:
+        job_ids = get_job_queue().submit_many(tasks)
+    except QueueFull:
+        st.error(t("queue_full"))
+        return
+    # Files from the previous generation are replaced
+    store.clear_session(get_session_id())
+    st.session_state.session_id = session_id
+    st.session_state.jobs = job_ids
+    st.session_state.generated_files = None
+    st.session_state.download_zip = None
+
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def render_jobs():
+    """Show the progress of queued worksheets, re-polling only this fragment."""
+    queue = get_job_queue()
+    jobs = [queue.get(job_id) for job_id in st.session_state.jobs]
+    finished = sum(1 for job in jobs if job is None or job.done)
+    st.progress(finished / len(jobs))
+    
+    for job in jobs:
+        if job is None:
+            st.error(t("job_expired"))
+        elif job.status == "failed":
+            st.error(t("error_generating", name=job.name, error=job.error))
+        elif job.status == "done":
+            _, error, _, _ = job.result
+            if error is None:
+                st.success(t("pdf_generated", name=job.name))
+            else:
+                st.error(t("pdf_failed", name=job.name, error=error))
+        else:
+            st.info(t(f"job_{job.status}", name=job.name))
+    
+    if finished < len(jobs):
+        return
+    
+    # Everything finished: collect the files and build the download archive once
+    generated_files = {}
+    totals = {}
+    for job in jobs:
+        if job is None or job.status != "done":
+            continue
+        files, _, _, report = job.result
+        generated_files.update(files)
+        for name, total, calls in report:
+            previous_total, previous_calls = totals.get(name, (0.0, 0))
+            totals[name] = (previous_total + total, previous_calls + calls)
+    elapsed = max((job.finished for job in jobs if job is not None), default=0.0) - \
+        min((job.submitted for job in jobs if job is not None), default=0.0)
+    st.session_state.last_generation = (elapsed, [(name, *totals[name]) for name in totals])
     
-    # Store in session state for persistence
     st.session_state.generated_files = generated_files
-    st.balloons()
+    if len(generated_files) > 1:
+        pdf_only_files = {k: v for k, v in generated_files.items() if k.endswith('.pdf')}
+        zip_path = get_artifact_store().session_path(get_session_id(), "math_worksheets.zip")
+        st.session_state.download_zip = create_zip_from_files(pdf_only_files, zip_path)
+    else:
+        st.session_state.download_zip = None
+    st.session_state.jobs = None
+    st.session_state.jobs_finished = True
+    st.rerun()
 
 
 def render_downloads():
@@ -705,18 +1072,26 @@ def render_downloads():
     generated_files = st.session_state.generated_files
     if not generated_files:
         return
+    # Only paths are kept in the session; the files may have been swept since
+    store = get_artifact_store()
+    store.sweep()
+    if not store.touch(get_session_id()) or not all(os.path.exists(path) for path in generated_files.values()):
+        st.warning(t("files_expired"))
+        st.session_state.generated_files = None
+        st.session_state.download_zip = None
+        return
 
-    # Create download buttons
+    # Create download buttons; files are read only when a button is clicked
     st.markdown("---")
     st.markdown(f"### {t('download_header')}")
     
     if len(generated_files) == 1:
         # Single file download
-        filename, content = list(generated_files.items())[0]
+        filename, path = list(generated_files.items())[0]
         mime = "application/pdf" if filename.endswith('.pdf') else "text/plain"
         st.download_button(
             label=t("download_file", filename=filename),
-            data=content,
+            data=lambda: read_file(path),
             file_name=filename,
             mime=mime
         )
@@ -725,12 +1100,11 @@ def render_downloads():
         col1, col2 = st.columns(2)
         
         with col1:
-            # Create zip file excluding .tex files
-            pdf_only_files = {k: v for k, v in generated_files.items() if k.endswith('.pdf')}
-            zip_buffer = create_zip_from_files(pdf_only_files)
+            # The archive (PDFs only) was built when the files were generated
+            zip_path = st.session_state.download_zip
             st.download_button(
                 label=t("download_all_zip"),
-                data=zip_buffer,
+                data=lambda: read_file(zip_path),
                 file_name="math_worksheets.zip",
                 mime="application/zip"
             )
@@ -738,19 +1112,39 @@ def render_downloads():
         with col2:
             st.markdown(t("individual_files"))
             # Individual file downloads (PDF only)
-            for filename, content in generated_files.items():
+            for filename, path in generated_files.items():
                 if filename.endswith('.tex'):
                     continue
                 
                 mime = "application/pdf"
                 st.download_button(
                     label=f"⬇️ {filename}",
-                    data=content,
+                    data=lambda path=path: read_file(path),
                     file_name=filename,
                     mime=mime,
                     key=f"dl_{filename}"
                 )
 
 
+def render_diagnostics():
+    """Render the stage timing breakdown of the last generation."""
+    elapsed, stages = st.session_state.last_generation
+    with st.expander(t("diagnostics_header"), expanded=False):
+        st.markdown(t("diagnostics_generation", seconds=elapsed))
+        st.table([
+            {
+                t("diagnostics_stage"): name,
+                t("diagnostics_total"): round(total * 1000, 1),
+                t("diagnostics_calls"): calls,
+            }
+            for name, total, calls in stages
+        ])
+        last_rerun = st.session_state.get('last_rerun')
+        if last_rerun:
+            rerun_ms, rerun_stages = last_rerun
+            details = "".join(f" · {name} {total * 1000:.1f}ms" for name, total, _ in rerun_stages)
+            st.caption(t("diagnostics_rerun", ms=rerun_ms * 1000) + details)
+
+
 if __name__ == "__main__":
     main()